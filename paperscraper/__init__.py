@@ -4,6 +4,7 @@ from .exceptions import DOINotFoundError
 from .lib import (
     a_gsearch_papers,
     a_search_papers,
+    a_search_papers_batch,
     arxiv_to_pdf,
     default_scraper,
     format_bibtex,
@@ -1008,8 +1008,12 @@ Mozilla/5.0 (iPhone; CPU iPhone OS 8_4 like Mac OS X) AppleWebKit/600.1.4 (KHTML
 """
 
 
+# Split once at import, skipping the blank lines around the block
+_USER_AGENTS = tuple(ua for ua in user_agents.splitlines() if ua)
+
+
 def get_user_agent() -> str:
-    return random.choice(user_agents.splitlines())
+    return random.choice(_USER_AGENTS)
 
 
 def get_header() -> dict[str, str]:
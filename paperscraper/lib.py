@@ -6,11 +6,12 @@ import logging
 import os
 import re
 import sys
-from collections.abc import Iterable
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterable
 from enum import Enum, IntEnum, auto
-from functools import partial
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from aiohttp import ClientResponse, ClientResponseError, ClientSession, InvalidURL
 
@@ -19,51 +20,66 @@ from .headers import get_header
 from .log_formatter import CustomFormatter
 from .scraper import Scraper
 from .utils import (
+    PDF_HEADER_SIZE,
+    PDF_MAGIC,
     ThrottledClientSession,
     crossref_headers,
+    crossref_mailto,
     encode_id,
     find_doi,
     get_scheme_hostname,
     search_pdf_link,
 )
 
-year_extract_pattern = re.compile(r"\b\d{4}\b")
-
+if TYPE_CHECKING:
+    from pybtex.database import BibliographyData
+    from pybtex.style.formatting import BaseStyle
 
+year_extract_pattern = re.compile(r"\b\d{4}\b")
+chemrxiv_pdf_link_pattern = re.compile(
+    r'content="(https://chemrxiv.org/engage/api-gateway/chemrxiv/assets.*\.pdf)"'
+)
+pmc_id_pattern = re.compile(r"PMC\d+")
+
+
+# WTF Semantic Scholar?
+BIBTEX_TYPE_MAPPING = {
+    "None": "article",
+    "Article": "article",
+    "JournalArticle": "article",
+    "Review": "article",
+    "Book": "book",
+    "BookSection": "inbook",
+    "ConferencePaper": "inproceedings",
+    "Conference": "inproceedings",
+    "Dataset": "misc",
+    "Dissertation": "phdthesis",
+    "Journal": "article",
+    "Patent": "patent",
+    "Preprint": "article",
+    "Report": "techreport",
+    "Thesis": "phdthesis",
+    "WebPage": "misc",
+    "Plain": "article",
+}
+bibtex_list_type_pattern = re.compile(r"@\['(.*)'\]")
+bibtex_type_pattern = re.compile(r"@(.*)\{")
+
+
+@lru_cache(maxsize=1024)
 def clean_upbibtex(bibtex: str) -> str:
-    # WTF Semantic Scholar?
-    mapping = {
-        "None": "article",
-        "Article": "article",
-        "JournalArticle": "article",
-        "Review": "article",
-        "Book": "book",
-        "BookSection": "inbook",
-        "ConferencePaper": "inproceedings",
-        "Conference": "inproceedings",
-        "Dataset": "misc",
-        "Dissertation": "phdthesis",
-        "Journal": "article",
-        "Patent": "patent",
-        "Preprint": "article",
-        "Report": "techreport",
-        "Thesis": "phdthesis",
-        "WebPage": "misc",
-        "Plain": "article",
-    }
-
     if "@None" in bibtex:
         return bibtex.replace("@None", "@article")
     # new format check
-    match = re.findall(r"@\['(.*)'\]", bibtex)
+    match = bibtex_list_type_pattern.findall(bibtex)
     if len(match) == 0:
-        match = re.findall(r"@(.*)\{", bibtex)
+        match = bibtex_type_pattern.findall(bibtex)
         bib_type = match[0]
         current = f"@{match[0]}"
     else:
         bib_type = match[0]
         current = f"@['{bib_type}']"
-    for k, v in mapping.items():
+    for k, v in BIBTEX_TYPE_MAPPING.items():
         # can have multiple
         if k in bib_type:
             bibtex = bibtex.replace(current, f"@{v}")
@@ -71,15 +87,34 @@ def clean_upbibtex(bibtex: str) -> str:
     return bibtex
 
 
+def parse_bibtex_string(bibtex: str) -> BibliographyData:
+    """
+    Parse BibTeX into pybtex's BibliographyData.
+
+    This skips pybtex.database.parse_string's plugin lookup by using the BibTeX
+    parser directly. A parser accumulates every entry it has parsed, so a new one is
+    made per call.
+    """
+    from pybtex.database.input.bibtex import Parser
+
+    return Parser().parse_string(bibtex)
+
+
+@lru_cache(maxsize=1)
+def _unsrtalpha_style() -> BaseStyle:
+    # Constructing a style looks up its name, label, and sorting plugins
+    from pybtex.style.formatting import unsrtalpha
+
+    return unsrtalpha.Style()
+
+
 def format_bibtex(bibtex, key, clean: bool = True) -> str:
     # WOWOW This is hard to use
-    from pybtex.database import parse_string
-    from pybtex.style.formatting import unsrtalpha
     from pybtex.style.template import FieldIsMissing
 
-    style = unsrtalpha.Style()
+    style = _unsrtalpha_style()
     try:
-        bd = parse_string(clean_upbibtex(bibtex) if clean else bibtex, "bibtex")
+        bd = parse_bibtex_string(clean_upbibtex(bibtex) if clean else bibtex)
     except Exception:
         return "Ref " + key
     try:
@@ -107,6 +142,52 @@ async def likely_pdf(response: ClientResponse) -> bool:
     return True
 
 
+PDF_DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes
+
+
+async def _iter_body(response: ClientResponse) -> AsyncIterator[bytes]:
+    if response.content.at_eof():  # Already read into memory, e.g. by likely_pdf
+        yield await response.read()
+        return
+    async for chunk in response.content.iter_chunked(PDF_DOWNLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def save_response(response: ClientResponse, path: str | os.PathLike) -> None:
+    """
+    Write a response's body to a file, streaming it in chunks if not yet read.
+
+    Bodies already read into memory (e.g. by likely_pdf) are written from memory,
+    so only unchecked responses like link_to_pdf's are actually streamed. The body
+    goes to a sibling ".part" file that is renamed to path once complete, so a
+    failed download never leaves a truncated file at path.
+
+    Raises:
+        RuntimeError: If the PDF magic bytes aren't in the body's header, in which
+            case nothing is written.
+    """
+    chunks = _iter_body(response)
+    # Buffer just enough of the body to validate it, before touching disk
+    head = b""
+    async for chunk in chunks:
+        head += chunk
+        if PDF_MAGIC in head or len(head) >= PDF_HEADER_SIZE:
+            break
+    if PDF_MAGIC not in head[:PDF_HEADER_SIZE]:
+        raise RuntimeError(f"Response from URL {response.url} isn't a PDF.")
+    part_path = f"{os.fspath(path)}.part"
+    try:
+        with open(part_path, "wb") as f:  # noqa: ASYNC101
+            f.write(head)
+            async for chunk in chunks:
+                f.write(chunk)
+    except BaseException:  # Includes cancellation
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, path)
+
+
 async def arxiv_to_pdf(arxiv_id, path, session: ClientSession) -> None:
     # download
     async with session.get(
@@ -114,8 +195,7 @@ async def arxiv_to_pdf(arxiv_id, path, session: ClientSession) -> None:
     ) as r:
         if not r.ok or not await likely_pdf(r):
             raise RuntimeError(f"No paper with arxiv id {arxiv_id}")
-        with open(path, "wb") as f:  # noqa: ASYNC101
-            f.write(await r.read())
+        await save_response(r, path)
 
 
 async def xiv_to_pdf(doi, path, domain: str, session: ClientSession) -> None:
@@ -123,8 +203,7 @@ async def xiv_to_pdf(doi, path, domain: str, session: ClientSession) -> None:
         f"https://{domain}/content/{doi}.full.pdf", allow_redirects=True
     ) as r:
         if r.ok and await likely_pdf(r):
-            with open(path, "wb") as f:  # noqa: ASYNC101
-                f.write(await r.read())
+            await save_response(r, path)
             return
 
 
@@ -133,8 +212,7 @@ async def link_to_pdf(url, path, session: ClientSession) -> None:
     async with session.get(url, allow_redirects=True) as r:
         r.raise_for_status()
         if "pdf" in r.headers["Content-Type"]:
-            with open(path, "wb") as f:  # noqa: ASYNC101
-                f.write(await r.read())
+            await save_response(r, path)
             return
         # try to find a pdf link
         html_text = await r.text()
@@ -144,10 +222,7 @@ async def link_to_pdf(url, path, session: ClientSession) -> None:
     # to break out of flow if I find a pdf
     def get_pdf() -> str:
         # try for chemrxiv special tag
-        pdf_link = re.search(
-            r'content="(https://chemrxiv.org/engage/api-gateway/chemrxiv/assets.*\.pdf)"',
-            html_text,
-        )
+        pdf_link = chemrxiv_pdf_link_pattern.search(html_text)
         if pdf_link:
             return pdf_link.group(1)
         try:
@@ -167,8 +242,7 @@ async def link_to_pdf(url, path, session: ClientSession) -> None:
         async with session.get(pdf_link, allow_redirects=True) as r:
             r.raise_for_status()
             if "pdf" in r.headers["Content-Type"]:
-                with open(path, "wb") as f:  # noqa: ASYNC101
-                    f.write(await r.read())
+                await save_response(r, path)
                 return
             raise RuntimeError(f"No PDF found from URL {pdf_link!r}.")
     except (TypeError, InvalidURL) as exc:
@@ -200,7 +274,7 @@ async def pubmed_to_pdf(pubmed_id, path, session: ClientSession) -> None:
                 f"Error fetching PMC ID for PubMed ID {pubmed_id}. {r.status}"
             )
         html_text = await r.text()
-        pmc_id_match = re.search(r"PMC\d+", html_text)
+        pmc_id_match = pmc_id_pattern.search(html_text)
         if pmc_id_match is None:
             raise RuntimeError(f"No PMC ID found for PubMed ID {pubmed_id}.")
         pmc_id = pmc_id_match.group(0)
@@ -225,8 +299,7 @@ async def pmc_to_pdf(
                 f"Failed to convert PubMed Central ID {pmc_id} to PDF given URL"
                 f" {pdf_url}."
             ) from cause_exc
-        with open(path, "wb") as f:  # noqa: ASYNC101
-            f.write(await r.read())
+        await save_response(r, path)
 
 
 async def arxiv_scraper(paper, path, session: ClientSession) -> bool:
@@ -502,12 +575,11 @@ async def reconcile_doi(title: str, authors: list[str], session: ClientSession)
     """
     # do not want initials
     authors_query = " ".join([a for a in authors if len(a) > 1])
-    mailto = os.environ.get("CROSSREF_MAILTO", "paperscraper@example.org")
     # get DOI via crossref
     url = "https://api.crossref.org/works"
     params = {
         "query.title": title,
-        "mailto": mailto,
+        "mailto": crossref_mailto(),
         "select": "DOI,score",
         "rows": "1",
     }
@@ -529,10 +601,54 @@ async def reconcile_doi(title: str, authors: list[str], session: ClientSession)
         return data["message"]["items"][0]["DOI"]
 
 
+async def reconcile_dois_bulk(
+    titles: Iterable[str], session: ClientSession
+) -> list[str]:
+    """
+    Look up DOIs for many titles using Crossref.
+
+    Crossref's works endpoint only takes one title query per request, so the lookups
+    are issued concurrently and the session's rate limit handles pacing.
+
+    Returns:
+        DOIs in the same order as the input titles.
+
+    Raises:
+        DOINotFoundError: If any of the reconciliations fail, see reconcile_doi.
+    """
+    return list(await asyncio.gather(*(reconcile_doi(t, [], session) for t in titles)))
+
+
+# Crossref's BibTeX for a given DOI doesn't change, so only fetch it once. Lookups
+# are cached as tasks so concurrent calls for one DOI share a request, and the cache
+# is a bounded LRU so long-running scrapes don't grow it without limit
+_BIBTEX_CACHE: OrderedDict[str, asyncio.Future[str]] = OrderedDict()
+_BIBTEX_CACHE_MAXSIZE = 1024
+
+
 async def doi_to_bibtex(doi: str, session: ClientSession) -> str:
+    task = _BIBTEX_CACHE.get(doi)
+    if task is None or task.cancelled():  # Cancelled, e.g. by a closed event loop
+        task = _BIBTEX_CACHE[doi] = asyncio.ensure_future(_doi_to_bibtex(doi, session))
+        if len(_BIBTEX_CACHE) > _BIBTEX_CACHE_MAXSIZE:
+            _BIBTEX_CACHE.popitem(last=False)
+    else:
+        _BIBTEX_CACHE.move_to_end(doi)
+    try:
+        # Shield so one caller's cancellation doesn't cancel the shared lookup
+        return await asyncio.shield(task)
+    except Exception:
+        # Don't cache failures, so a later call can retry
+        if _BIBTEX_CACHE.get(doi) is task:
+            del _BIBTEX_CACHE[doi]
+        raise
+
+
+async def _doi_to_bibtex(doi: str, session: ClientSession) -> str:
     # get DOI via crossref
     url = f"https://api.crossref.org/works/{doi}/transform/application/x-bibtex"
-    async with session.get(url, headers=crossref_headers()) as r:
+    params = {"mailto": crossref_mailto()}
+    async with session.get(url, params=params, headers=crossref_headers()) as r:
         if not r.ok:
             raise DOINotFoundError(
                 f"Per HTTP status code {r.status}, could not resolve DOI {doi}."
@@ -640,6 +756,40 @@ class SematicScholarSearchType(IntEnum):
 # The fact that 20 is actually the max value was not in the SERP API docs as
 # of 4/15/2024, but was determined by contacting SERP support
 GOOGLE_SEARCH_MAX_PAGE_SIZE = 20
+# SEE: https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/post_graph_get_papers
+SEMANTIC_SCHOLAR_BATCH_MAX_IDS = 500
+
+
+def _default_logger(verbose: bool = False) -> logging.Logger:
+    """Get the 'paper-scraper' logger, colorized to stderr at DEBUG level if verbose."""
+    logger = logging.getLogger("paper-scraper")
+    logger.setLevel(logging.ERROR)
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+        ch = logging.StreamHandler()
+        ch.setFormatter(CustomFormatter())
+        logger.addHandler(ch)
+    return logger
+
+
+def _semantic_scholar_session_kwargs(
+    api_key: str | None, rate_limit: float
+) -> dict[str, Any]:
+    """
+    Make ThrottledClientSession keyword arguments for querying Semantic Scholar.
+
+    Args:
+        api_key: Optional Semantic Scholar API key, otherwise attempt to pull it from
+            the environment variable SEMANTIC_SCHOLAR_API_KEY.
+        rate_limit: Rate limit (requests/sec) to use if there's no API key.
+    """
+    headers = get_header()
+    if api_key is None:
+        api_key = os.environ.get("SEMANTIC_SCHOLAR_API_KEY")
+    if api_key is not None:
+        headers["x-api-key"] = api_key
+        rate_limit = RateLimits.SEMANTIC_SCHOLAR.value
+    return {"headers": headers, "rate_limit": rate_limit}
 
 
 async def a_search_papers(  # noqa: C901, PLR0912, PLR0915
@@ -689,13 +839,7 @@ async def a_search_papers(  # noqa: C901, PLR0912, PLR0915
     pdir = Path(pdir)
     pdir.mkdir(exist_ok=True)
     if logger is None:
-        logger = logging.getLogger("paper-scraper")
-        logger.setLevel(logging.ERROR)
-        if verbose:
-            logger.setLevel(logging.DEBUG)
-            ch = logging.StreamHandler()
-            ch.setFormatter(CustomFormatter())
-            logger.addHandler(ch)
+        logger = _default_logger(verbose)
     params = {"fields": SEMANTIC_SCHOLAR_API_FIELDS}
     if _limit > 100:  # noqa: PLR2004
         raise NotImplementedError("Didn't handle Semantic Scholar pagination ('next').")
@@ -756,18 +900,10 @@ async def a_search_papers(  # noqa: C901, PLR0912, PLR0915
         {str(k): v for k, v in _paths.items()} if _paths is not None else {}
     )
     scraper = scraper or default_scraper()
-    ssheader = get_header()
-    if semantic_scholar_api_key is not None:
-        ssheader["x-api-key"] = semantic_scholar_api_key
-        rate_limit = RateLimits.SEMANTIC_SCHOLAR.value
-    else:
-        # check if it's in the environment
-        with contextlib.suppress(KeyError):
-            ssheader["x-api-key"] = os.environ["SEMANTIC_SCHOLAR_API_KEY"]
-            rate_limit = RateLimits.SEMANTIC_SCHOLAR.value
-    async with ThrottledClientSession(
-        rate_limit=rate_limit, headers=ssheader
-    ) as ss_session:
+    ss_session_kwargs = _semantic_scholar_session_kwargs(
+        semantic_scholar_api_key, rate_limit
+    )
+    async with ThrottledClientSession(**ss_session_kwargs) as ss_session:
         async with ss_session.get(
             url=google_endpoint if search_type == "google" else endpoint,
             params=google_params if search_type == "google" else params,
@@ -804,9 +940,7 @@ async def a_search_papers(  # noqa: C901, PLR0912, PLR0915
                             google_pdf_links[i] = res["link"]
 
             # want this separate, since ss is rate_limit for Google
-            async with ThrottledClientSession(
-                rate_limit=rate_limit, headers=ssheader
-            ) as ss_sub_session:
+            async with ThrottledClientSession(**ss_session_kwargs) as ss_sub_session:
                 # Now we need to reconcile with S2 API these results
                 async def google2s2(
                     title: str, year: str | None, pdf_link
@@ -916,6 +1050,84 @@ async def a_search_papers(  # noqa: C901, PLR0912, PLR0915
     return paths
 
 
+async def a_search_papers_batch(
+    dois: Iterable[str],
+    limit: int | None = None,
+    pdir: str | os.PathLike = os.curdir,
+    semantic_scholar_api_key: str | None = None,
+    logger: logging.Logger | None = None,
+    verbose: bool = False,
+    scraper: Scraper | None = None,
+    batch_size: int = 10,
+) -> dict[str, dict[str, Any]]:
+    """
+    Asynchronously look up many DOIs using Semantic Scholar, and scrape them.
+
+    Unlike the 'doi' search_type of a_search_papers, this uses Semantic Scholar's
+    batch endpoint, which looks up to 500 DOIs per request.
+
+    Args:
+        dois: DOIs to look up.
+        limit: Optional target result count, passed to Scraper.batch_scrape.
+        pdir: Optional directory (created if it does not exist), that defaults to the
+            current directory, passed to Scraper.batch_scrape's paper_file_dump_dir.
+        semantic_scholar_api_key: Optional Semantic Scholar API key, otherwise
+            attempt to pull it from the environment variable SEMANTIC_SCHOLAR_API_KEY.
+        logger: Optional logger to use for logging. If left as default of None,
+            a 'paper-scraper' logger at ERROR level will be used.
+        verbose: Set True to colorized log to stderr at DEBUG level.
+        scraper: Optional scraper to use after searching. If left as default of None,
+            the default scraper will be created.
+        batch_size: Passed through to Scraper.batch_scrape's batch_size.
+
+    Returns:
+        Scraper.batch_scrape output, where DOIs not found in Semantic Scholar are
+            logged and skipped.
+    """
+    pdir = Path(pdir)
+    pdir.mkdir(exist_ok=True)
+    if logger is None:
+        logger = _default_logger(verbose)
+    dois = list(dois)
+    scraper = scraper or default_scraper()
+    ss_session_kwargs = _semantic_scholar_session_kwargs(
+        semantic_scholar_api_key, RateLimits.FALLBACK_SLOW.value
+    )
+    papers: list[dict[str, Any]] = []
+    async with ThrottledClientSession(**ss_session_kwargs) as ss_session:
+        for i in range(0, len(dois), SEMANTIC_SCHOLAR_BATCH_MAX_IDS):
+            batch = dois[i : i + SEMANTIC_SCHOLAR_BATCH_MAX_IDS]
+            async with ss_session.post(
+                url=f"{SEMANTIC_SCHOLAR_BASE_URL}/graph/v1/paper/batch",
+                params={"fields": SEMANTIC_SCHOLAR_API_FIELDS},
+                json={"ids": [f"DOI:{doi}" for doi in batch]},
+            ) as response:
+                try:
+                    response.raise_for_status()
+                except ClientResponseError as exc:
+                    raise RuntimeError(
+                        f"Error looking up DOIs {i + 1} to {i + len(batch)} of"
+                        f" {len(dois)}."
+                    ) from exc
+                data = await response.json()
+            # Semantic Scholar responds with null for IDs it doesn't have
+            for doi, paper in zip(batch, data, strict=True):
+                if paper is None:
+                    logger.warning(f"DOI {doi} not found.")
+                else:
+                    papers.append(paper)
+    paths = await scraper.batch_scrape(
+        papers,
+        paper_file_dump_dir=pdir,
+        paper_parser=parse_semantic_scholar_metadata,
+        batch_size=batch_size,
+        limit=limit,
+        logger=logger,
+    )
+    await scraper.close()
+    return paths
+
+
 async def a_gsearch_papers(  # noqa: C901
     query: str,
     limit: int = 10,
@@ -932,13 +1144,7 @@ async def a_gsearch_papers(  # noqa: C901
     pdir = Path(pdir)
     pdir.mkdir(exist_ok=True)
     if logger is None:
-        logger = logging.getLogger("paper-scraper")
-        logger.setLevel(logging.ERROR)
-        if verbose:
-            logger.setLevel(logging.DEBUG)
-            ch = logging.StreamHandler()
-            ch.setFormatter(CustomFormatter())
-            logger.addHandler(ch)
+        logger = _default_logger(verbose)
     # SEE: https://serpapi.com/google-scholar-api
     endpoint = "https://serpapi.com/search.json"
     # adjust _limit if limit is smaller (with margin for scraping errors)
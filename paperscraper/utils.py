@@ -8,15 +8,19 @@ import random
 import re
 import time
 import urllib.parse
-from collections.abc import Collection
+from collections.abc import Collection, Mapping
+from functools import lru_cache
 from logging import Logger
-from typing import Literal, TypeVar, cast, overload
+from typing import Literal, TypeVar, overload
 from uuid import UUID
 
 import aiohttp
 import fitz
+from aiohttp.typedefs import StrOrURL
+from yarl import URL
 
 from paperscraper.exceptions import NoPDFLinkError
+from paperscraper.version import __version__
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +36,12 @@ class ThrottledClientSession(aiohttp.ClientSession):
     TIME_BASE = MAX_WAIT_FOR_CLOSE - 1  # sec
 
     def __init__(
-        self, rate_limit: float | None = None, retry_count: int = 5, *args, **kwargs
+        self,
+        rate_limit: float | None = None,
+        retry_count: int = 5,
+        *args,
+        host_rate_limits: Mapping[str, float] | None = None,
+        **kwargs,
     ) -> None:
         """
         Initialize.
@@ -43,54 +52,66 @@ class ThrottledClientSession(aiohttp.ClientSession):
             retry_count: Number of retries to attempt on service limit status codes, set
                 to 0 to disable retries.
             *args: Positional arguments to pass to aiohttp.ClientSession.__init__.
+            host_rate_limits: Optional mapping of host to number of requests per second
+                to throttle requests to that host, in place of rate_limit. This lets
+                requests to different hosts proceed independently. Hosts not present
+                fall back to rate_limit.
             **kwargs: Keyword arguments to pass to aiohttp.ClientSession.__init__.
         """
         super().__init__(*args, **kwargs)
         self._rate_limit = rate_limit
         self._retry_count = retry_count
         self._start_time = time.time()
-        if rate_limit is not None:
-            queue_size = int(rate_limit * self.TIME_BASE)
-            if queue_size < 1:
-                raise ValueError(
-                    f"Rate limit {rate_limit} is too low for a responsive close, please"
-                    f" increase to at least {1 / self.TIME_BASE} requests/sec."
-                )
-            self._queue: asyncio.Queue | None = asyncio.Queue(maxsize=queue_size)
-            self._fillerTask: asyncio.Task | None = asyncio.create_task(self._filler())
-        else:
-            self._queue = None
-            self._fillerTask = None
+        self._filler_tasks: list[asyncio.Task] = []
+        self._queue: asyncio.Queue | None = (
+            self._create_bucket(rate_limit) if rate_limit is not None else None
+        )
+        self._host_queues: dict[str, asyncio.Queue] = {
+            host: self._create_bucket(host_rate_limit)
+            for host, host_rate_limit in (host_rate_limits or {}).items()
+        }
+
+    def _create_bucket(self, rate_limit: float) -> asyncio.Queue:
+        """Create a leaky bucket queue, and start its filler task."""
+        queue_size = int(rate_limit * self.TIME_BASE)
+        if queue_size < 1:
+            raise ValueError(
+                f"Rate limit {rate_limit} is too low for a responsive close, please"
+                f" increase to at least {1 / self.TIME_BASE} requests/sec."
+            )
+        queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._filler_tasks.append(asyncio.create_task(self._filler(queue, rate_limit)))
+        return queue
 
     async def close(self) -> None:
-        """Close rate-limiter's "bucket filler" task."""
-        if self._fillerTask is not None:
+        """Close rate-limiters' "bucket filler" tasks."""
+        if self._filler_tasks:
             # There exists an edge case where an empty session gets closed
             # before the filler task even starts. In this edge case, we employ
             # a small asyncio sleep to give a chance to start the filler task.
             await asyncio.sleep(delay=1e-3)
-            self._fillerTask.cancel()
-            await asyncio.wait_for(self._fillerTask, timeout=self.MAX_WAIT_FOR_CLOSE)
+            for task in self._filler_tasks:
+                task.cancel()
+            await asyncio.wait_for(
+                asyncio.gather(*self._filler_tasks), timeout=self.MAX_WAIT_FOR_CLOSE
+            )
         await super().close()
 
-    async def _filler(self) -> None:
+    async def _filler(self, queue: asyncio.Queue, rate_limit: float) -> None:
         """Filler task to fill the leaky bucket algo."""
-        if self._rate_limit is None:
-            return
-        queue = cast(asyncio.Queue, self._queue)
         # This sleep interval (sec) is enough to enqueue at least 1 request
         # - If 1 / rate_limit is above 1e-3, we should add on average 1 request
         #   to the queue per below loop iteration
         # - Otherwise, we'll add on average above 1 request to the queue per
         #   below loop iteration
-        sleep_interval = max(1 / self._rate_limit, 1e-3)  # sec
+        sleep_interval = max(1 / rate_limit, 1e-3)  # sec
         ts_before_sleep = time.perf_counter()
         try:
             while True:
                 ts_after_sleep = time.perf_counter()
                 # Calculate how many requests to add to the bucket based on elapsed time.
                 num_requests_to_add = int(
-                    (ts_after_sleep - ts_before_sleep) * self._rate_limit
+                    (ts_after_sleep - ts_before_sleep) * rate_limit
                 )
                 # Calculate available space in the queue to avoid overfilling it.
                 available_space = queue.maxsize - queue.qsize()
@@ -106,17 +127,21 @@ class ThrottledClientSession(aiohttp.ClientSession):
         except Exception:
             logger.exception("Unexpected failure in queue filling.")
 
-    async def _wait_can_make_request(self) -> None:
-        if self._queue is not None:
-            await self._queue.get()
-            self._queue.task_done()
+    async def _wait_can_make_request(self, host: str | None = None) -> None:
+        queue = self._host_queues.get(host, self._queue) if host else self._queue
+        if queue is not None:
+            await queue.get()
+            queue.task_done()
 
     SERVICE_LIMIT_REACHED_STATUS_CODES: Collection[int] = {429, 503}
 
-    async def _request(self, *args, **kwargs) -> aiohttp.ClientResponse:
+    async def _request(
+        self, method: str, str_or_url: StrOrURL, *args, **kwargs
+    ) -> aiohttp.ClientResponse:
+        host = URL(str_or_url).host if self._host_queues else None
         for retry_num in range(self._retry_count + 1):
-            await self._wait_can_make_request()
-            response = await super()._request(*args, **kwargs)
+            await self._wait_can_make_request(host)
+            response = await super()._request(method, str_or_url, *args, **kwargs)
             if response.status not in self.SERVICE_LIMIT_REACHED_STATUS_CODES:
                 break
             if retry_num < self._retry_count:
@@ -137,10 +162,23 @@ class ThrottledClientSession(aiohttp.ClientSession):
         return response
 
 
-def check_pdf(path: str | os.PathLike, verbose: bool | Logger = False) -> bool:
+def check_pdf(
+    path: str | os.PathLike, verbose: bool | Logger = False, strict: bool = True
+) -> bool:
+    """
+    Check if a file is a readable PDF.
+
+    Args:
+        path: Path to the file.
+        verbose: Set True to print, or pass a Logger to log, why a PDF was unreadable.
+        strict: Default of True opens the document with fitz to catch corruption, set
+            False to instead cheaply check only for the PDF header and trailer.
+    """
     path = str(path)
     if not os.path.exists(path):
         return False
+    if not strict:
+        return _has_pdf_markers(path)
 
     try:
         # Open the PDF file using fitz
@@ -157,6 +195,25 @@ def check_pdf(path: str | os.PathLike, verbose: bool | Logger = False) -> bool:
     return True
 
 
+PDF_MAGIC = b"%PDF-"
+PDF_EOF_MARKER = b"%%EOF"
+# Readers (including fitz) accept the PDF magic anywhere in the first 1024 bytes
+PDF_HEADER_SIZE = 1024  # bytes
+# The PDF spec allows the EOF marker anywhere in the last 1024 bytes
+PDF_TRAILER_SIZE = 1024  # bytes
+
+
+def _has_pdf_markers(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            if PDF_MAGIC not in f.read(PDF_HEADER_SIZE):
+                return False
+            f.seek(max(f.seek(0, os.SEEK_END) - PDF_TRAILER_SIZE, 0))
+            return PDF_EOF_MARKER in f.read()
+    except OSError:
+        return False
+
+
 # SEE: https://www.crossref.org/blog/dois-and-matching-regular-expressions/
 # Test cases: https://regex101.com/r/xtI5bS/10
 pattern = r"\/(10.\d{4,9}(?:[\/\.][a-z-().]*(?:[-<>()\/;:\w]*\d+[-<>();:\w]*)+)+)"
@@ -168,12 +225,16 @@ def find_doi(text: str, disallow_no_match: Literal[True]) -> str: ...
 @overload
 def find_doi(text: str, disallow_no_match: Literal[False] = False) -> str | None: ...
 def find_doi(text: str, disallow_no_match: bool = False) -> str | None:
+    doi = _search_doi(text)
+    if doi is None and disallow_no_match:
+        raise ValueError(f"Failed to find DOI in {text!r}.")
+    return doi
+
+
+@lru_cache(maxsize=4096)
+def _search_doi(text: str) -> str | None:
     match = compiled_pattern.search(urllib.parse.unquote(text))
-    if not match:
-        if disallow_no_match:
-            raise ValueError(f"Failed to find DOI in {text!r}.")
-        return None
-    return match.group(1)
+    return match.group(1) if match else None
 
 
 def encode_id(value: str | bytes | UUID, maxsize: int | None = 16) -> str:
@@ -197,23 +258,33 @@ def get_scheme_hostname(url: str) -> str:
     ).geturl()
 
 
+epdf_link_pattern = re.compile(r'href="(\S+\.epdf)"')
+pdf_link_pattern = re.compile(r'href="(\S+\.pdf)"')
+
+
 def search_pdf_link(text: str, epdf: bool = False) -> str:
     if epdf:
-        epdf_link = re.search(r'href="(\S+\.epdf)"', text)
+        epdf_link = epdf_link_pattern.search(text)
         if epdf_link:
             return epdf_link.group(1).replace("epdf", "pdf")
     else:
-        pdf_link = re.search(r'href="(\S+\.pdf)"', text)
+        pdf_link = pdf_link_pattern.search(text)
         if pdf_link:
             return pdf_link.group(1)
     raise NoPDFLinkError("No PDF link found.")
 
 
-def crossref_headers():
-    """Crossref API key if available, otherwise nothing."""
+def crossref_mailto() -> str:
+    """Contact email sent to Crossref, so requests go to its faster polite pool."""
+    return os.environ.get("CROSSREF_MAILTO") or "paperscraper@example.org"
+
+
+def crossref_headers() -> dict[str, str]:
+    """Crossref polite pool User-Agent, plus the API key if available."""
+    headers = {"User-Agent": f"paperscraper/{__version__} (mailto:{crossref_mailto()})"}
     if api_key := os.environ.get("CROSSREF_API_KEY"):
-        return {"Crossref-Plus-API-Token": f"Bearer {api_key}"}
-    return {}
+        headers["Crossref-Plus-API-Token"] = f"Bearer {api_key}"
+    return headers
 
 
 T = TypeVar("T")
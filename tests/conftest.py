@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import sys
+from collections.abc import AsyncIterator, Callable
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+import aiohttp
+import fitz
+import pytest
+import pytest_asyncio
+from aiohttp import ClientSession
+
+import paperscraper
+from paperscraper.headers import get_header
+from paperscraper.lib import RateLimits
+from paperscraper.scraper import Scraper
+from paperscraper.utils import ThrottledClientSession
+
+
+# Hosts the http_session tests download from or query
+_WARMUP_URLS = (
+    "https://api.crossref.org/",
+    "https://arxiv.org/",
+    "https://www.biorxiv.org/",
+    "https://www.medrxiv.org/",
+    "https://www.ncbi.nlm.nih.gov/",
+)
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--net",
+        action="store_true",
+        help="Run tests marked network, same as setting PAPERSCRAPER_RUN_NETWORK.",
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    # Network tests are slow and spend API rate limits, so they're opt-in
+    if config.getoption("--net") or os.environ.get("PAPERSCRAPER_RUN_NETWORK"):
+        return
+    skip_network_marker = pytest.mark.skip(
+        reason="Pass --net or set PAPERSCRAPER_RUN_NETWORK=1."
+    )
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip_network_marker)
+
+
+def pytest_asyncio_loop_factories(
+    config: pytest.Config,  # noqa: ARG001
+    item: pytest.Item,  # noqa: ARG001
+) -> dict[str, Callable[[], asyncio.AbstractEventLoop]]:
+    # Run async tests on uvloop, which has lower per-task overhead
+    if sys.platform == "win32":  # uvloop doesn't support Windows
+        return {"asyncio": asyncio.new_event_loop}
+    import uvloop
+
+    return {"uvloop": uvloop.new_event_loop}
+
+
+def _throttled_cached_session(
+    cache_path: str | os.PathLike, **kwargs
+) -> ThrottledClientSession:
+    """
+    Make a ThrottledClientSession that replays responses cached in a SQLite file.
+
+    Cache hits skip the network, and misses are throttled like any other request.
+    """
+    from aiohttp_client_cache import SQLiteBackend
+    from aiohttp_client_cache.session import CacheMixin
+
+    class ThrottledCachedSession(CacheMixin, ThrottledClientSession):
+        pass
+
+    return ThrottledCachedSession(
+        cache=SQLiteBackend(str(cache_path), expire_after=86400), **kwargs
+    )
+
+
+async def _head(session: ClientSession, url: str) -> None:
+    async with session.head(url):  # Releases the connection back to the pool
+        pass
+
+
+@pytest_asyncio.fixture(scope="session")
+async def http_session(pytestconfig: pytest.Config) -> AsyncIterator[ClientSession]:
+    """Session shared across tests, so connections and DNS lookups get reused."""
+    cache_http = bool(os.environ.get("PAPERSCRAPER_CACHE_HTTP"))
+    if cache_http:
+        pytest.importorskip("aiohttp_client_cache")
+    connector = aiohttp.TCPConnector(
+        # Cap per-host connections, so concurrent tests stay polite to each host
+        limit=32,
+        limit_per_host=4,
+        # Resolve each host once per test session, without blocking a thread
+        resolver=aiohttp.AsyncResolver(),
+        ttl_dns_cache=3600,
+        happy_eyeballs_delay=0.1,
+        # Keep idle connections longer than the default 15-sec, since the slowest
+        # rate limits space requests to a host several seconds apart
+        keepalive_timeout=30,
+        enable_cleanup_closed=True,
+    )
+    session_kwargs: dict[str, Any] = {
+        "headers": get_header(),
+        "rate_limit": RateLimits.FALLBACK_SLOW.value,
+        # Give each repeatedly hit host its own budget, so hosts don't wait on
+        # each other
+        "host_rate_limits": dict.fromkeys(
+            (
+                "arxiv.org",
+                "www.biorxiv.org",
+                "www.medrxiv.org",
+                "www.ncbi.nlm.nih.gov",
+                "pubmed.ncbi.nlm.nih.gov",
+            ),
+            RateLimits.FALLBACK_SLOW.value,
+        ),
+        "connector": connector,
+    }
+    session: ThrottledClientSession
+    try:
+        if cache_http:
+            # Replay responses cached on disk, so reruns of tests using this session
+            # only hit the network on cache misses. Searches open their own
+            # sessions, so they aren't cached
+            session = _throttled_cached_session(
+                pytestconfig.rootpath / ".test_http_cache", **session_kwargs
+            )
+        else:
+            # Prime the shared connector's DNS cache and TLS connections, using an
+            # unthrottled session so the warm-up doesn't spend the rate limit
+            async with ClientSession(
+                connector=connector,
+                connector_owner=False,
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as warmup_session:
+                await asyncio.gather(
+                    *(_head(warmup_session, url) for url in _WARMUP_URLS),
+                    return_exceptions=True,
+                )
+            session = ThrottledClientSession(**session_kwargs)
+    except BaseException:
+        # The session takes ownership of the connector, so only close it ourselves
+        # if no session was made
+        await connector.close()
+        raise
+    async with session:
+        yield session
+
+
+@pytest.fixture
+def throttled_cached_session() -> Callable[..., ThrottledClientSession]:
+    """Factory for http_session's cached session, used with PAPERSCRAPER_CACHE_HTTP."""
+    pytest.importorskip("aiohttp_client_cache")
+    return _throttled_cached_session
+
+
+@pytest_asyncio.fixture(scope="session")
+async def default_scraper() -> AsyncIterator[Scraper]:
+    """
+    Default scraper shared across tests, since building one opens many sessions.
+
+    Don't pass it to functions like a_search_papers that close the scraper they're
+    given, as that would leave closed sessions for the rest of the test session.
+    """
+    scraper = paperscraper.default_scraper()
+    yield scraper
+    await scraper.close()
+
+
+@pytest.fixture(scope="session")
+def pdf_bytes() -> bytes:
+    """Minimal valid PDF, for serving from mocked responses."""
+    with fitz.open() as doc:
+        doc.new_page()
+        return doc.tobytes()
+
+
+@pytest.fixture
+def pdf_session(pdf_bytes: bytes) -> MagicMock:
+    """Mocked session whose GET requests all respond with a PDF."""
+
+    @contextlib.asynccontextmanager
+    async def mock_get(*_, **__) -> AsyncIterator[MagicMock]:
+        response = MagicMock(spec_set=aiohttp.ClientResponse)
+        response.ok = True
+        response.status = 200
+        response.headers = {"Content-Type": "application/pdf"}
+        response.text.return_value = pdf_bytes.decode("latin-1")
+        response.read.return_value = pdf_bytes
+        response.content.at_eof.return_value = False
+        response.content.iter_chunked.return_value.__aiter__.return_value = [pdf_bytes]
+        yield response
+
+    session = MagicMock()
+    session.get.side_effect = mock_get
+    return session
+
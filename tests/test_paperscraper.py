@@ -3,16 +3,19 @@ from __future__ import annotations
 import asyncio
 import contextlib
 import os
-import tempfile
 import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
 from functools import partial
-from unittest import IsolatedAsyncioTestCase
+from pathlib import Path
+from typing import Any
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import aiohttp
 import pytest
-from aiohttp import ClientResponseError
-from pybtex.database import parse_string
+import pytest_asyncio
+from aiohttp import ClientResponseError, web
+from aiohttp.test_utils import TestServer
 
 import paperscraper
 from paperscraper.exceptions import (
@@ -20,197 +23,278 @@ from paperscraper.exceptions import (
     DOINotFoundError,
     NoPDFLinkError,
 )
-from paperscraper.headers import get_header
+from paperscraper.headers import _USER_AGENTS, get_header
 from paperscraper.lib import (
     GOOGLE_SEARCH_MAX_PAGE_SIZE,
+    SEMANTIC_SCHOLAR_BATCH_MAX_IDS,
     RateLimits,
     clean_upbibtex,
     doi_to_bibtex,
     format_bibtex,
     openaccess_scraper,
+    parse_bibtex_string,
     parse_google_scholar_metadata,
     reconcile_doi,
+    reconcile_dois_bulk,
+    save_response,
 )
 from paperscraper.utils import (
     ThrottledClientSession,
+    crossref_headers,
     encode_id,
     find_doi,
     search_pdf_link,
 )
 
 
-class TestThrottledClientSession(IsolatedAsyncioTestCase):
-    async def test_throttling(self) -> None:
-
-        async def get(session_: aiohttp.ClientSession) -> None:
-            async with session_.get(
-                "http://example.com", timeout=aiohttp.ClientTimeout(3.0)
-            ) as response:
-                response.raise_for_status()
-                await response.text()
-
-        tic = time.perf_counter()
-        async with ThrottledClientSession() as session:
-            await asyncio.gather(*(get(session) for _ in range(6)))
-        assert time.perf_counter() - tic < 1, "Expected no throttling"
-
-        tic = time.perf_counter()
-        async with ThrottledClientSession(rate_limit=2) as session:
-            await asyncio.gather(*(get(session) for _ in range(6)))
-        assert 2.5 <= time.perf_counter() - tic <= 4.0, "Expected throttling"
-
-    async def test_can_timeout(self) -> None:
-        for rate_limit in (None, 1):
-            async with ThrottledClientSession(rate_limit=rate_limit) as session:
-                tic = time.perf_counter()
-                try:
-                    async with session.get(
-                        # This URL should always timeout
-                        "http://example.com:81",
-                        timeout=aiohttp.ClientTimeout(3.0),
-                    ):
-                        pass
-                except asyncio.TimeoutError:
-                    toc = time.perf_counter()
-                    assert 3.0 <= toc - tic <= 5.0, "Expected timeout"
-                else:
-                    raise AssertionError(
-                        f"Should have timed out with rate limit {rate_limit}."
-                    )
-
-    async def test_empty_session(self) -> None:
-        """Check an empty session doesn't crash us."""
-        async with ThrottledClientSession(rate_limit=30.0):
-            pass
-
-    async def test_service_limit(self) -> None:
-        async with ThrottledClientSession(rate_limit=10.0) as session:
-            with (
-                patch.object(
-                    aiohttp.ClientSession,
-                    "_request",
-                    wraps=partial(aiohttp.ClientSession._request, session),
-                ) as mock_request,
-                pytest.raises(RuntimeError, match="service limit"),
-            ):
-                await session.get(
-                    "http://httpbin.org/status/429", headers={"accept": "text/plain"}
+@pytest.mark.network
+async def test_throttling() -> None:
+
+    async def get(session_: aiohttp.ClientSession) -> None:
+        async with session_.get(
+            "http://example.com", timeout=aiohttp.ClientTimeout(3.0)
+        ) as response:
+            response.raise_for_status()
+            await response.text()
+
+    tic = time.perf_counter()
+    async with ThrottledClientSession() as session:
+        await asyncio.gather(*(get(session) for _ in range(6)))
+    assert time.perf_counter() - tic < 1, "Expected no throttling"
+
+    tic = time.perf_counter()
+    async with ThrottledClientSession(rate_limit=2) as session:
+        await asyncio.gather(*(get(session) for _ in range(6)))
+    assert 2.5 <= time.perf_counter() - tic <= 4.0, "Expected throttling"
+
+
+async def test_throttled_cached_session(
+    throttled_cached_session: Callable[..., ThrottledClientSession], tmp_path: Path
+) -> None:
+    hits = 0
+
+    async def handler(_: web.Request) -> web.Response:
+        nonlocal hits
+        hits += 1
+        return web.Response(body=b"%PDF-1.7 stub")
+
+    app = web.Application()
+    app.router.add_get("/test.pdf", handler)
+    async with TestServer(app) as server, throttled_cached_session(
+        tmp_path / "cache", rate_limit=10.0
+    ) as session:
+        with patch.object(
+            session, "_wait_can_make_request", wraps=session._wait_can_make_request
+        ) as mock_wait:
+            for _ in range(2):
+                async with session.get(server.make_url("/test.pdf")) as response:
+                    assert await response.read() == b"%PDF-1.7 stub"
+    assert hits == 1, "Expected the second request to replay from the cache"
+    mock_wait.assert_awaited_once()  # Only the cache miss spends the rate limit
+
+
+@pytest.mark.network
+async def test_can_timeout() -> None:
+    for rate_limit in (None, 1):
+        async with ThrottledClientSession(rate_limit=rate_limit) as session:
+            tic = time.perf_counter()
+            try:
+                async with session.get(
+                    # This URL should always timeout
+                    "http://example.com:81",
+                    timeout=aiohttp.ClientTimeout(3.0),
+                ):
+                    pass
+            except asyncio.TimeoutError:
+                toc = time.perf_counter()
+                assert 3.0 <= toc - tic <= 5.0, "Expected timeout"
+            else:
+                raise AssertionError(
+                    f"Should have timed out with rate limit {rate_limit}."
                 )
-        assert (
-            mock_request.call_count == 6
-        ), "Expected first attempt followed by 5 retries"
 
 
-class TestCrossref(IsolatedAsyncioTestCase):
-    async def test_reconcile_dois(self) -> None:
-        session = ThrottledClientSession(
-            headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-        )
-        doi = "10.1056/nejmoa2200674"
+async def test_empty_session() -> None:
+    """Check an empty session doesn't crash us."""
+    async with ThrottledClientSession(rate_limit=30.0):
+        pass
 
-        bibtex = await doi_to_bibtex(doi, session)
-        assert bibtex
 
-        # get title
-        title = bibtex.split("title={")[1].split("},")[0]
-        assert await reconcile_doi(title, [], session) == doi
+async def test_host_rate_limits() -> None:
+    async with ThrottledClientSession(
+        host_rate_limits={"slow.example.com": 10.0}
+    ) as session:
+        with patch.object(
+            aiohttp.ClientSession, "_request", return_value=MagicMock(status=200)
+        ):
+            tic = time.perf_counter()
+            await asyncio.gather(*(session.get("http://example.com") for _ in range(6)))
+            assert time.perf_counter() - tic < 0.1, "Expected unlisted host unthrottled"
+
+            tic = time.perf_counter()
+            await asyncio.gather(*(
+                session.get("http://slow.example.com/path") for _ in range(6)
+            ))
+            assert 0.4 <= time.perf_counter() - tic <= 1.5, "Expected throttling"
+
+
+@pytest.mark.network
+async def test_service_limit() -> None:
+    async with ThrottledClientSession(rate_limit=10.0) as session:
+        with (
+            patch.object(
+                aiohttp.ClientSession,
+                "_request",
+                wraps=partial(aiohttp.ClientSession._request, session),
+            ) as mock_request,
+            pytest.raises(RuntimeError, match="service limit"),
+        ):
+            await session.get(
+                "http://httpbin.org/status/429", headers={"accept": "text/plain"}
+            )
+    assert mock_request.call_count == 6, "Expected first attempt followed by 5 retries"
 
-        # format
-        key = bibtex.split("{")[1].split(",")[0]
-        assert format_bibtex(bibtex, key, clean=False)
 
-    async def test_hard_reconciles(self):
-        test_parameters: list[dict] = [
-            {
-                "title": (
-                    "High-throughput screening of human genetic variants by pooled"
-                    " prime editing."
-                ),
-                "doi": "10.1101/2024.04.01.587366",
-            },
-            {
-                "title": (
-                    "High-throughput screening of human genetic variants by pooled"
-                    " prime editing."
-                ),
-                "authors": ["garbage", "authors", "that"],
-                "doi": "10.1101/2024.04.01.587366",
-            },
-            {
-                "title": (
-                    "High throughput screening of human genetic variants by pooled"
-                    " prime editing"
-                ),
-                "doi": "10.1101/2024.04.01.587366",
-            },
-        ]
-        session = ThrottledClientSession(headers=get_header(), rate_limit=15 / 60)
-        for test in test_parameters:
-            assert await reconcile_doi(test["title"], [], session) == test["doi"]
+@pytest.mark.network
+async def test_reconcile_dois(http_session: ThrottledClientSession) -> None:
+    doi = "10.1056/nejmoa2200674"
 
+    bibtex = await doi_to_bibtex(doi, http_session)
+    assert bibtex
 
-def test_find_doi() -> None:
-    test_parameters = [
-        ("", None),
-        ("https://www.sciencedirect.com/science/article/pii/S001046551930373X", None),
-        ("https://www.academia.edu/download/110406132/2.pdf", None),
-        ("https://doi.org/10.1056/nejmoa2200674", "10.1056/nejmoa2200674"),
-        (
-            "https://www.biorxiv.org/content/10.1101/2024.01.31.578268v1",
-            "10.1101/2024.01.31.578268v1",
-        ),
-        (
-            "https://www.biorxiv.org/content/10.1101/2024.01.31.578268v1.full-text",
-            "10.1101/2024.01.31.578268v1",
-        ),
-        (
-            "https://www.taylorfrancis.com/chapters/edit/10.1201/9781003240037-2/impact-covid-vaccination-globe-using-data-analytics-pawan-whig-arun-velu-rahul-reddy-pavika-sharma",
-            "10.1201/9781003240037-2",
-        ),
-        (
-            "https://iopscience.iop.org/article/10.7567/1882-0786/ab5c44/meta",
-            "10.7567/1882-0786/ab5c44",
-        ),
-        (
-            "https://iopscience.iop.org/article/10.7567/abc123abc/meta",
-            "10.7567/abc123abc",
-        ),
-        (
-            "https://iopscience.iop.org/article/10.7567/abc123abc.pdf",
-            "10.7567/abc123abc",
-        ),
-        (
-            "https://dx.doi.org/10.1016/j.arth.2005.04.023",
-            "10.1016/j.arth.2005.04.023",
-        ),
-        ("https://doi.org/10.48550/arXiv.2401.00044", "10.48550/arXiv.2401.00044"),
-        (
-            "https://doi.org/10.26434/chemrxiv-2023-fw8n4-v3",
-            "10.26434/chemrxiv-2023-fw8n4-v3",
-        ),
-        (
-            "https://www.biorxiv.org/content/10.1101/2022.08.05.502972.full.pdf",
-            "10.1101/2022.08.05.502972",
-        ),
-        (
-            "https://doi.org/10.1002/(SICI)1097-0177(200006)218:2%3C235::AID-DVDY2%3E3.0.CO;2-G",
-            "10.1002/(SICI)1097-0177(200006)218:2<235::AID-DVDY2>3.0.CO;2-G",
-        ),
-        (
-            "https://anatomypubs.onlinelibrary.wiley.com/doi/10.1002/(SICI)1097-0177(200006)218:2%3C235::AID-DVDY2%3E3.0.CO;2-G",
-            "10.1002/(SICI)1097-0177(200006)218:2<235::AID-DVDY2>3.0.CO;2-G",
-        ),
-        ("https://doi.org/10.1093/nar/gkae222", "10.1093/nar/gkae222"),
-        (
-            "https://doi.org/10.1007/s13592-019-00684-x?wt_mc=internal.event.1.sem.articleauthoronlinefirst&utm_source=articleauthoronlinefirst&utm_medium=email&utm_content=aa_en_06082018&articleauthoronlinefirst_20190913&fbclid=iwar2ipcqh8tqoyocdb2ryt-rqf2slmyf3s4k5_qwonmipan9_nqc_wiuabhi",
-            "10.1007/s13592-019-00684-x",
-        ),
+    # get title
+    title = bibtex.split("title={")[1].split("},")[0]
+    assert await reconcile_doi(title, [], http_session) == doi
+
+    # format
+    key = bibtex.split("{")[1].split(",")[0]
+    assert format_bibtex(bibtex, key, clean=False)
+
+
+async def test_doi_to_bibtex_is_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Isolate from the module-level cache, so the stub DOI doesn't leak
+    monkeypatch.setattr("paperscraper.lib._BIBTEX_CACHE", OrderedDict())
+    mock_session = MagicMock()
+
+    @contextlib.asynccontextmanager
+    async def mock_session_get(*_, **__):
+        mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+        mock_response.ok = True
+        mock_response.text.side_effect = [
+            "@article{Doe_2024, title={Stub}, author={Doe, Jane}, year={2024}}"
+        ]
+        yield mock_response
+
+    mock_session.get.side_effect = mock_session_get
+    expected = "@article{Doe2024Stub, title={Stub}, author={Doe, Jane}, year={2024}}"
+    # Concurrent lookups share one request, and later lookups replay it
+    assert await asyncio.gather(
+        doi_to_bibtex("10.1234/stub", mock_session),
+        doi_to_bibtex("10.1234/stub", mock_session),
+    ) == [expected, expected]
+    assert await doi_to_bibtex("10.1234/stub", mock_session) == expected
+    mock_session.get.assert_called_once()
+
+    # Least recently used DOIs get evicted past the size bound
+    monkeypatch.setattr("paperscraper.lib._BIBTEX_CACHE_MAXSIZE", 1)
+    await doi_to_bibtex("10.1234/other", mock_session)
+    assert list(paperscraper.lib._BIBTEX_CACHE) == ["10.1234/other"]
+
+
+@pytest.mark.network
+async def test_hard_reconciles(http_session: ThrottledClientSession) -> None:
+    test_parameters: list[dict] = [
+        {
+            "title": (
+                "High-throughput screening of human genetic variants by pooled"
+                " prime editing."
+            ),
+            "doi": "10.1101/2024.04.01.587366",
+        },
+        {
+            "title": (
+                "High-throughput screening of human genetic variants by pooled"
+                " prime editing."
+            ),
+            "authors": ["garbage", "authors", "that"],
+            "doi": "10.1101/2024.04.01.587366",
+        },
+        {
+            "title": (
+                "High throughput screening of human genetic variants by pooled"
+                " prime editing"
+            ),
+            "doi": "10.1101/2024.04.01.587366",
+        },
     ]
-    for link, expected in test_parameters:
-        if expected is None:
-            assert find_doi(link) is None
-        else:
-            assert find_doi(link) == expected
+    dois = await reconcile_dois_bulk(
+        [t["title"] for t in test_parameters], http_session
+    )
+    for test, doi in zip(test_parameters, dois, strict=True):
+        assert doi == test["doi"]
+
+
+_FIND_DOI_CASES = (
+    ("", None),
+    ("https://www.sciencedirect.com/science/article/pii/S001046551930373X", None),
+    ("https://www.academia.edu/download/110406132/2.pdf", None),
+    ("https://doi.org/10.1056/nejmoa2200674", "10.1056/nejmoa2200674"),
+    (
+        "https://www.biorxiv.org/content/10.1101/2024.01.31.578268v1",
+        "10.1101/2024.01.31.578268v1",
+    ),
+    (
+        "https://www.biorxiv.org/content/10.1101/2024.01.31.578268v1.full-text",
+        "10.1101/2024.01.31.578268v1",
+    ),
+    (
+        "https://www.taylorfrancis.com/chapters/edit/10.1201/9781003240037-2/impact-covid-vaccination-globe-using-data-analytics-pawan-whig-arun-velu-rahul-reddy-pavika-sharma",
+        "10.1201/9781003240037-2",
+    ),
+    (
+        "https://iopscience.iop.org/article/10.7567/1882-0786/ab5c44/meta",
+        "10.7567/1882-0786/ab5c44",
+    ),
+    (
+        "https://iopscience.iop.org/article/10.7567/abc123abc/meta",
+        "10.7567/abc123abc",
+    ),
+    (
+        "https://iopscience.iop.org/article/10.7567/abc123abc.pdf",
+        "10.7567/abc123abc",
+    ),
+    (
+        "https://dx.doi.org/10.1016/j.arth.2005.04.023",
+        "10.1016/j.arth.2005.04.023",
+    ),
+    ("https://doi.org/10.48550/arXiv.2401.00044", "10.48550/arXiv.2401.00044"),
+    (
+        "https://doi.org/10.26434/chemrxiv-2023-fw8n4-v3",
+        "10.26434/chemrxiv-2023-fw8n4-v3",
+    ),
+    (
+        "https://www.biorxiv.org/content/10.1101/2022.08.05.502972.full.pdf",
+        "10.1101/2022.08.05.502972",
+    ),
+    (
+        "https://doi.org/10.1002/(SICI)1097-0177(200006)218:2%3C235::AID-DVDY2%3E3.0.CO;2-G",
+        "10.1002/(SICI)1097-0177(200006)218:2<235::AID-DVDY2>3.0.CO;2-G",
+    ),
+    (
+        "https://anatomypubs.onlinelibrary.wiley.com/doi/10.1002/(SICI)1097-0177(200006)218:2%3C235::AID-DVDY2%3E3.0.CO;2-G",
+        "10.1002/(SICI)1097-0177(200006)218:2<235::AID-DVDY2>3.0.CO;2-G",
+    ),
+    ("https://doi.org/10.1093/nar/gkae222", "10.1093/nar/gkae222"),
+    (
+        "https://doi.org/10.1007/s13592-019-00684-x?wt_mc=internal.event.1.sem.articleauthoronlinefirst&utm_source=articleauthoronlinefirst&utm_medium=email&utm_content=aa_en_06082018&articleauthoronlinefirst_20190913&fbclid=iwar2ipcqh8tqoyocdb2ryt-rqf2slmyf3s4k5_qwonmipan9_nqc_wiuabhi",
+        "10.1007/s13592-019-00684-x",
+    ),
+)
+
+
+@pytest.mark.parametrize(("link", "expected"), _FIND_DOI_CASES)
+def test_find_doi(link: str, expected: str | None) -> None:
+    assert find_doi(link) == expected
 
 
 def test_encode_id() -> None:
@@ -221,6 +305,19 @@ def test_encode_id() -> None:
     )
 
 
+def test_get_header() -> None:
+    assert _USER_AGENTS and all(ua.strip() for ua in _USER_AGENTS)
+    assert get_header()["User-Agent"] in _USER_AGENTS
+
+
+def test_crossref_headers(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROSSREF_MAILTO", "someone@example.org")
+    monkeypatch.delenv("CROSSREF_API_KEY", raising=False)
+    headers = crossref_headers()
+    assert headers.keys() == {"User-Agent"}
+    assert headers["User-Agent"].endswith("(mailto:someone@example.org)")
+
+
 def test_format_bibtex_badkey():
     bibtex1 = """
             @article{Moreira2022Safety,
@@ -241,65 +338,82 @@ def test_format_bibtex_badkey():
     assert format_bibtex(bibtex1, "Moreira2022Safety", clean=False)
 
 
-class Test0(IsolatedAsyncioTestCase):
-    async def test_google_search_papers(self) -> None:
-        for query, year, limit in [
-            ("molecular dynamics", "2019-2023", 5),
-            ("molecular dynamics", "2020", 5),
-            ("covid vaccination", None, 10),
-        ]:
-            with self.subTest():
-                papers = await paperscraper.a_search_papers(
-                    query, search_type="google", year=year, limit=limit
-                )
-                assert len(papers) >= 3
-
-    async def test_with_multiple_google_search_pages(self) -> None:
-        papers = await paperscraper.a_search_papers(
-            "molecular dynamics",
-            search_type="google",
-            year="2019-2023",
-            limit=int(2.1 * GOOGLE_SEARCH_MAX_PAGE_SIZE),
-        )
-        assert len(papers) > GOOGLE_SEARCH_MAX_PAGE_SIZE
-
-
-class TestGSearch(IsolatedAsyncioTestCase):
-    async def test_gsearch(self):
-        query = "molecular dynamics"
-        papers = await paperscraper.a_gsearch_papers(query, year="2019-2023", limit=3)
-        assert len(papers) >= 3
-
-        # check their details
-        for paper in papers.values():
-            assert paper["citation"]
-            assert paper["key"]
-            assert paper["url"]
-            assert paper["year"]
-            assert paper["paperId"]
-            assert paper["citationCount"]
-            assert paper["title"]
-
-    async def test_with_multiple_google_search_pages(self) -> None:
-        papers = await paperscraper.a_gsearch_papers(
-            "molecular dynamics", year="2019-2023", limit=5, _limit=2
+@pytest.mark.network
+async def test_google_search_papers(tmp_path: Path) -> None:
+    cases = [
+        ("molecular dynamics", "2019-2023", 5),
+        ("molecular dynamics", "2020", 5),
+        ("covid vaccination", None, 10),
+    ]
+    results = await asyncio.gather(*(
+        paperscraper.a_search_papers(
+            query, search_type="google", year=year, limit=limit, pdir=tmp_path / str(i)
         )
-        assert len(papers) >= 5
+        for i, (query, year, limit) in enumerate(cases)
+    ))
+    for (query, year, _), papers in zip(cases, results, strict=True):
+        assert len(papers) >= 3, f"Failed search for {query!r} in year {year!r}."
+
+
+@pytest.mark.network
+async def test_search_papers_with_multiple_google_search_pages(tmp_path: Path) -> None:
+    papers = await paperscraper.a_search_papers(
+        "molecular dynamics",
+        search_type="google",
+        year="2019-2023",
+        limit=int(2.1 * GOOGLE_SEARCH_MAX_PAGE_SIZE),
+        pdir=tmp_path,
+    )
+    assert len(papers) > GOOGLE_SEARCH_MAX_PAGE_SIZE
 
-    async def test_no_link_doesnt_crash_us(self) -> None:
-        await paperscraper.a_gsearch_papers(
-            "OAG-BERT: Pre-train Heterogeneous Entity-augmented Academic Language"
-            " Models",
-            year="2021",
-        )
 
-    async def test_no_doi_doesnt_crash_us(self) -> None:
-        await paperscraper.a_gsearch_papers(
-            "Letters to the American People, Part II (2019–2024)",  # noqa: RUF001
-            year="2024",
-        )
+@pytest.mark.network
+async def test_gsearch(tmp_path: Path) -> None:
+    query = "molecular dynamics"
+    papers = await paperscraper.a_gsearch_papers(
+        query, year="2019-2023", limit=3, pdir=tmp_path
+    )
+    assert len(papers) >= 3
+
+    # check their details
+    for paper in papers.values():
+        assert paper["citation"]
+        assert paper["key"]
+        assert paper["url"]
+        assert paper["year"]
+        assert paper["paperId"]
+        assert paper["citationCount"]
+        assert paper["title"]
+
+
+@pytest.mark.network
+async def test_gsearch_with_multiple_google_search_pages(tmp_path: Path) -> None:
+    papers = await paperscraper.a_gsearch_papers(
+        "molecular dynamics", year="2019-2023", limit=5, _limit=2, pdir=tmp_path
+    )
+    assert len(papers) >= 5
 
 
+@pytest.mark.network
+async def test_no_link_doesnt_crash_us(tmp_path: Path) -> None:
+    await paperscraper.a_gsearch_papers(
+        "OAG-BERT: Pre-train Heterogeneous Entity-augmented Academic Language"
+        " Models",
+        year="2021",
+        pdir=tmp_path,
+    )
+
+
+@pytest.mark.network
+async def test_no_doi_doesnt_crash_us(tmp_path: Path) -> None:
+    await paperscraper.a_gsearch_papers(
+        "Letters to the American People, Part II (2019–2024)",  # noqa: RUF001
+        year="2024",
+        pdir=tmp_path,
+    )
+
+
+@pytest.mark.network
 @pytest.mark.parametrize(
     ("title", "scraper_should_succeed"),
     [(
@@ -307,8 +421,7 @@ class TestGSearch(IsolatedAsyncioTestCase):
         "arxiv",
     )],
 )
-@pytest.mark.asyncio()
-async def test_gsearch_examples(title, scraper_should_succeed):
+async def test_gsearch_examples(title, scraper_should_succeed, tmp_path: Path):
     result = None
 
     async def status_callback(paper_title, scrape_result):
@@ -326,7 +439,9 @@ async def test_gsearch_examples(title, scraper_should_succeed):
         if s.name != scraper_should_succeed:
             scraper.deregister_scraper(s.name)
 
-    papers = await paperscraper.a_gsearch_papers(title, limit=1, scraper=scraper)
+    papers = await paperscraper.a_gsearch_papers(
+        title, limit=1, scraper=scraper, pdir=tmp_path
+    )
     assert len(papers) >= 1
     if result:
         assert scraper_should_succeed in result, "Scraper specified did not run"
@@ -337,510 +452,632 @@ async def test_gsearch_examples(title, scraper_should_succeed):
         raise AssertionError("No result from callback")
 
 
-class Test1(IsolatedAsyncioTestCase):
-    async def test_arxiv_to_pdf(self):
-        arxiv_id = "1706.03762"
-        path = "test.pdf"
-        async with ThrottledClientSession(
-            headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-        ) as session:
-            await paperscraper.arxiv_to_pdf(arxiv_id, path, session)
-        assert paperscraper.check_pdf(path)
-        os.remove(path)
-
-    async def test_biorxiv_to_pdf(self):
-        biorxiv_doi = "10.1101/2024.01.25.577217"
-        path = "test.pdf"
-        async with ThrottledClientSession(
-            headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-        ) as session:
-            await paperscraper.xiv_to_pdf(biorxiv_doi, path, "www.biorxiv.org", session)
-        assert paperscraper.check_pdf(path)
-        os.remove(path)
-
-    async def test_medrxiv_to_pdf(self):
-        biorxiv_doi = "10.1101/2024.03.06.24303847"
-        path = "test.pdf"
-        async with ThrottledClientSession(
-            headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-        ) as session:
-            await paperscraper.xiv_to_pdf(biorxiv_doi, path, "www.medrxiv.org", session)
-        assert paperscraper.check_pdf(path)
-        os.remove(path)
-
-    async def test_pmc_to_pdf(self) -> None:
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            for _ in range(3):  # Retrying on 403, pulling different header each retry
-                async with ThrottledClientSession(
-                    headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-                ) as session:
-                    cause_exc: Exception | None = None
-                    try:
-                        await paperscraper.pmc_to_pdf("8971931", tmpfile.name, session)
-                    except RuntimeError as exc:
-                        cause_exc = exc
-                    else:
-                        if paperscraper.check_pdf(tmpfile.name):
-                            return
-        raise AssertionError(
-            "Failed to download and check PDF from PMC."
-        ) from cause_exc
-
-    def test_search_pdf_link(self) -> None:
-        for url, expected in (
-            ('<link rel="schema.DC" href="http://abc.org/DC/elements/1.0/" />', None),
-            (
-                '<a href="/doi/suppl/10.1010/spam.ham.0a0/some_file/abc_001.pdf" class="ext-link">PDF</a>',  # noqa: E501
-                "/doi/suppl/10.1010/spam.ham.0a0/some_file/abc_001.pdf",
-            ),
-            (
-                '<form method="POST" action="/deliver/fulltext/foo/71/1/spam-ham-123-456.pdf?itemId=%2Fcontent%2Fjournals%2F10.1010%2Fabc-def-012000-123&mimeType=pdf&containerItemId=content/journals/applesauce"\ntarget="/content/journals/10.1010/abc-def-012000-123-pdf" \ndata-title',  # noqa: E501
-                None,
-            ),
-            (
-                '<a href="#" class="fa fa-file-pdf-o access-options-icon"\nrole="button"><span class="sr-only">file format pdf download</span></a>',  # noqa: E501
-                None,
-            ),
-        ):
-            if isinstance(expected, str):
-                assert search_pdf_link(url) == expected
+_DOWNLOAD_CASES: dict[str, tuple[Callable[..., Awaitable[None]], str]] = {
+    "arxiv": (paperscraper.arxiv_to_pdf, "1706.03762"),
+    "biorxiv": (
+        partial(paperscraper.xiv_to_pdf, domain="www.biorxiv.org"),
+        "10.1101/2024.01.25.577217",
+    ),
+    "medrxiv": (
+        partial(paperscraper.xiv_to_pdf, domain="www.medrxiv.org"),
+        "10.1101/2024.03.06.24303847",
+    ),
+    "link": (
+        paperscraper.link_to_pdf,
+        "https://www.aclweb.org/anthology/N18-3011.pdf",
+    ),
+    "sagepub": (
+        paperscraper.link_to_pdf,
+        "https://journals.sagepub.com/doi/pdf/10.1177/1087057113498418",
+    ),
+}
+# Cases whose host may refuse our downloads with a 403
+_FORBIDDEN_TOLERANT_CASES = {"sagepub"}
+
+
+@pytest.mark.network
+async def test_all_downloads(
+    http_session: ThrottledClientSession, tmp_path: Path
+) -> None:
+    # Each case hits a different host, so download them concurrently
+    paths = {name: tmp_path / f"{name}.pdf" for name in _DOWNLOAD_CASES}
+    results = await asyncio.gather(
+        *(
+            fn(arg, paths[name], session=http_session)
+            for name, (fn, arg) in _DOWNLOAD_CASES.items()
+        ),
+        return_exceptions=True,  # Let every case finish, to report all failures
+    )
+    failures: dict[str, str] = {}
+    for (name, path), result in zip(paths.items(), results, strict=True):
+        if isinstance(result, BaseException):
+            if name in _FORBIDDEN_TOLERANT_CASES and "403" in str(result):
+                continue
+            failures[name] = repr(result)
+        elif not paperscraper.check_pdf(path):  # Real downloads get fitz's full check
+            failures[name] = "not a readable PDF"
+    assert not failures, f"Failed downloads: {failures}."
+
+
+_MOCKED_DOWNLOAD_URLS = {
+    "arxiv": "https://arxiv.org/pdf/1706.03762.pdf",
+    "biorxiv": "https://www.biorxiv.org/content/10.1101/2024.01.25.577217.full.pdf",
+    "medrxiv": "https://www.medrxiv.org/content/10.1101/2024.03.06.24303847.full.pdf",
+    "link": "https://www.aclweb.org/anthology/N18-3011.pdf",
+    "sagepub": "https://journals.sagepub.com/doi/pdf/10.1177/1087057113498418",
+}
+
+
+@pytest.mark.parametrize("name", list(_DOWNLOAD_CASES))
+async def test_download_mocked(
+    name: str, tmp_path: Path, pdf_session: MagicMock
+) -> None:
+    fn, arg = _DOWNLOAD_CASES[name]
+    path = tmp_path / "test.pdf"
+    await fn(arg, path, session=pdf_session)
+    assert pdf_session.get.call_args.args[0] == _MOCKED_DOWNLOAD_URLS[name]
+    assert paperscraper.check_pdf(path)
+
+
+def test_check_pdf_strict(tmp_path: Path, pdf_bytes: bytes) -> None:
+    valid, corrupt = tmp_path / "valid.pdf", tmp_path / "corrupt.pdf"
+    valid.write_bytes(pdf_bytes)
+    corrupt.write_bytes(b"%PDF-1.7\ngarbage\n%%EOF\n")
+    paywall = tmp_path / "paywall.pdf"
+    paywall.write_bytes(b"<html>Access denied</html>")  # Like a publisher paywall
+    assert paperscraper.check_pdf(valid)
+    assert paperscraper.check_pdf(valid, strict=False)
+    assert not paperscraper.check_pdf(corrupt), "Expected fitz to reject the body"
+    assert paperscraper.check_pdf(corrupt, strict=False), "Expected markers to pass"
+    assert not paperscraper.check_pdf(paywall, strict=False)
+
+
+def test_check_pdf_markers(tmp_path: Path) -> None:
+    (tmp_path / "good.pdf").write_bytes(b"%PDF-1.7\n%%EOF\n")
+    # Junk before the header is tolerated, as long as it's within 1024 bytes
+    (tmp_path / "offset.pdf").write_bytes(b"\xef\xbb\xbf\n%PDF-1.7\n%%EOF\n")
+    (tmp_path / "late.pdf").write_bytes(b" " * 1024 + b"%PDF-1.7\n%%EOF\n")
+    (tmp_path / "truncated.pdf").write_bytes(b"%PDF-1.7\n" + b"0" * 2048)
+    expected = {
+        "good.pdf": True,
+        "offset.pdf": True,
+        "late.pdf": False,
+        "truncated.pdf": False,
+        "missing.pdf": False,
+    }
+    assert {
+        name: paperscraper.check_pdf(tmp_path / name, strict=False)
+        for name in expected
+    } == expected
+
+
+_RETRY_DOWNLOAD_CASES: dict[str, tuple[Callable[..., Awaitable[None]], str]] = {
+    "pmc": (paperscraper.pmc_to_pdf, "8971931"),
+    "pubmed": (paperscraper.pubmed_to_pdf, "27525504"),
+    "medrxiv-link": (
+        paperscraper.link_to_pdf,
+        "https://www.medrxiv.org/content/medrxiv/early/2020/03/23/2020.03.20.20040055.full.pdf",  # noqa: E501
+    ),
+    "chemrxiv-link": (
+        paperscraper.link_to_pdf,
+        "https://doi.org/10.26434/chemrxiv-2023-fw8n4",
+    ),
+}
+
+
+@pytest.mark.network
+@pytest.mark.parametrize("name", list(_RETRY_DOWNLOAD_CASES))
+async def test_download_with_retries(
+    name: str, http_session: ThrottledClientSession, tmp_path: Path
+) -> None:
+    fn, arg = _RETRY_DOWNLOAD_CASES[name]
+    path = tmp_path / "test.pdf"
+    cause_exc: Exception | None = None
+    original_headers = http_session.headers.copy()
+    try:
+        for _ in range(3):  # Retrying on 403, pulling different header each retry
+            http_session.headers.update(get_header())
+            try:
+                await fn(arg, path, session=http_session)
+            except (RuntimeError, ClientResponseError) as exc:
+                cause_exc = exc
             else:
-                try:
-                    search_pdf_link(url)
-                except NoPDFLinkError:
-                    pass
-                else:
-                    raise AssertionError("Should be unreachable")
+                if paperscraper.check_pdf(path):
+                    return
+                # Download completed but PDF is invalid
+    finally:
+        # Restore the shared session's headers, so the rotated User-Agent doesn't
+        # carry over to later tests
+        http_session.headers.clear()
+        http_session.headers.update(original_headers)
+    raise AssertionError(f"Failed to download and check PDF for {name}.") from cause_exc
+
+
+def test_search_pdf_link() -> None:
+    for url, expected in (
+        ('<link rel="schema.DC" href="http://abc.org/DC/elements/1.0/" />', None),
+        (
+            '<a href="/doi/suppl/10.1010/spam.ham.0a0/some_file/abc_001.pdf" class="ext-link">PDF</a>',  # noqa: E501
+            "/doi/suppl/10.1010/spam.ham.0a0/some_file/abc_001.pdf",
+        ),
+        (
+            '<form method="POST" action="/deliver/fulltext/foo/71/1/spam-ham-123-456.pdf?itemId=%2Fcontent%2Fjournals%2F10.1010%2Fabc-def-012000-123&mimeType=pdf&containerItemId=content/journals/applesauce"\ntarget="/content/journals/10.1010/abc-def-012000-123-pdf" \ndata-title',  # noqa: E501
+            None,
+        ),
+        (
+            '<a href="#" class="fa fa-file-pdf-o access-options-icon"\nrole="button"><span class="sr-only">file format pdf download</span></a>',  # noqa: E501
+            None,
+        ),
+    ):
+        if isinstance(expected, str):
+            assert search_pdf_link(url) == expected
+        else:
+            try:
+                search_pdf_link(url)
+            except NoPDFLinkError:
+                pass
+            else:
+                raise AssertionError("Should be unreachable")
 
-    async def test_openaccess_scraper(self) -> None:
-        assert not await openaccess_scraper(
-            {"openAccessPdf": None}, MagicMock(), MagicMock()
-        )
 
-        mock_session = MagicMock()
-        call_index = 0
-
-        @contextlib.asynccontextmanager
-        async def mock_session_get(*_, **__):
-            mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
-            nonlocal call_index
-            call_index += 1
-            if call_index == 1:
-                mock_response.text.side_effect = [
-                    '<a class="suppl-anchor" href="/doi/suppl/10.1021/acs.nanolett.0c00513/suppl_file/nl0c00513_si_001.pdf">'  # noqa: E501
-                ]
-            else:
-                mock_response.headers = {
-                    "Content-Type": "application/pdf;charset=UTF-8"
-                }
-                mock_response.read.side_effect = [b"stub"]
-            yield mock_response
-
-        mock_session.get.side_effect = mock_session_get
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            await openaccess_scraper(
-                {
-                    "openAccessPdf": {
-                        "url": (
-                            "https://pubs.acs.org/doi/abs/10.1021/acs.nanolett.0c00513"
-                        )
-                    }
-                },
-                tmpfile.name,
-                mock_session,
-            )
+async def test_openaccess_scraper(tmp_path: Path) -> None:
+    assert not await openaccess_scraper(
+        {"openAccessPdf": None}, tmp_path / "test.pdf", AsyncMock()
+    )
 
-    async def test_pubmed_to_pdf(self) -> None:
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            for _ in range(3):  # Retrying on 403, pulling different header each retry
-                async with ThrottledClientSession(
-                    headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-                ) as session:
-                    cause_exc: Exception | None = None
-                    try:
-                        await paperscraper.pubmed_to_pdf(
-                            "27525504", tmpfile.name, session
-                        )
-                    except RuntimeError as exc:
-                        cause_exc = exc
-                    else:
-                        if paperscraper.check_pdf(tmpfile.name):
-                            return
-        raise AssertionError(
-            "Failed to download and check PDF from PubMed ID."
-        ) from cause_exc
-
-    async def test_link_to_pdf(self):
-        link = "https://www.aclweb.org/anthology/N18-3011.pdf"
-        path = "test.pdf"
-        async with ThrottledClientSession(
-            headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-        ) as session:
-            await paperscraper.link_to_pdf(link, path, session)
-        assert paperscraper.check_pdf(path)
-        os.remove(path)
-
-    async def test_link2_to_pdf_that_can_raise_403(self) -> None:
-        link = "https://journals.sagepub.com/doi/pdf/10.1177/1087057113498418"
-        path = "test.pdf"
-        try:
-            async with ThrottledClientSession(
-                headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-            ) as session:
-                await paperscraper.link_to_pdf(link, path, session)
-            os.remove(path)
-
-        except (RuntimeError, aiohttp.ClientResponseError) as e:
-            assert "403" in str(e)  # noqa: PT017
-
-    async def test_link3_to_pdf(self) -> None:
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            for _ in range(3):  # Retrying
-                async with ThrottledClientSession(
-                    headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-                ) as session:
-                    await paperscraper.link_to_pdf(
-                        "https://www.medrxiv.org/content/medrxiv/early/2020/03/23/2020.03.20.20040055.full.pdf",
-                        tmpfile.name,
-                        session,
-                    )
-                    if paperscraper.check_pdf(tmpfile.name):
-                        return
-        raise AssertionError("Failed to download and check PDF from medRxiv.")
-
-    async def test_chemrxivlink_to_pdf(self) -> None:
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            async with ThrottledClientSession(
-                headers=get_header(), rate_limit=RateLimits.FALLBACK_SLOW.value
-            ) as session:
-                for _ in range(3):  # Retrying if invalid PDF download or 403 error
-                    with contextlib.suppress(ClientResponseError):  # 403 error
-                        await paperscraper.link_to_pdf(
-                            "https://doi.org/10.26434/chemrxiv-2023-fw8n4",
-                            tmpfile.name,
-                            session,
-                        )
-                        if paperscraper.check_pdf(tmpfile.name):
-                            return
-                        # Download completed but PDF is invalid
-        raise AssertionError("Failed to download and check PDF from ChemRxiv.")
-
-
-class Test2(IsolatedAsyncioTestCase):
-    async def test_search_papers(self):
-        query = "molecular dynamics"
-        papers = await paperscraper.a_search_papers(query, limit=1)
-        assert len(papers) >= 1
-
-
-class Test3(IsolatedAsyncioTestCase):
-    async def test_search_papers_offset(self):
-        query = "molecular dynamics"
-        papers = await paperscraper.a_search_papers(query, limit=10, _limit=5)
-        assert len(papers) >= 10
-
-
-class Test4(IsolatedAsyncioTestCase):
-    async def test_search_papers_plain(self):
-        query = "meta-reinforcement learning meta reinforcement learning"
-        papers = await paperscraper.a_search_papers(query, limit=3, verbose=True)
-        assert len(papers) >= 3
-
-
-class Test5(IsolatedAsyncioTestCase):
-
-    async def test_search_papers_year(self) -> None:
-        query = "covid vaccination"
-
-        for year, name in [
-            ("2019-2023", "normal range"),
-            ("2023-2022", "flipped order"),
-            (". 2021-2023", "discard upon bad formatting"),
-        ]:
-            with self.subTest(msg=name):
-                papers = await paperscraper.a_search_papers(query, limit=1, year=year)
-                assert len(papers) >= 1
-
-
-class Test6(IsolatedAsyncioTestCase):
-    async def test_verbose(self):
-        query = "Fungi"
-        papers = await paperscraper.a_search_papers(query, limit=1, verbose=False)
-        assert len(papers) >= 1
-
-
-class TestScraper(IsolatedAsyncioTestCase):
-    async def test_custom_scraper(self) -> None:
-        query = "covid vaccination"
-        mock_scrape_fn = MagicMock()
-
-        async def custom_scraper(paper, path, **kwargs):
-            mock_scrape_fn(paper, path, **kwargs)
-
-        scraper = paperscraper.Scraper()
-        scraper.register_scraper(custom_scraper, priority=0, name="test", check=False)
-        try:
-            await paperscraper.a_search_papers(query, scraper=scraper)
-        except RuntimeError as exc:
-            assert (  # noqa: PT017
-                exc.__cause__.status == 400  # type: ignore[union-attr]
-            ), "Expected we should exhaust the search"
-
-    async def test_scraper_callback(self) -> None:
-        # make sure default scraper doesn't duplicate scrapers
-        scraper = paperscraper.default_scraper()
-
-        async def callback(paper, result):  # noqa: ARG001
-            assert len(result) > 5
-
-        scraper.callback = callback
-        papers = await paperscraper.a_search_papers(  # noqa: F841
-            "test", limit=1, scraper=scraper
-        )
-        await scraper.close()
-
-    def test_scrape_default_timeout(self) -> None:
-        os.environ.pop("PAPERSCRAPER_SCRAPE_FUNCTION_TIMEOUT", None)
-        assert paperscraper.Scraper.SCRAPE_FUNCTION_TIMEOUT == 60.0
-
-    async def test_scraper_timeout(self) -> None:
-        os.environ.pop("PAPERSCRAPER_SCRAPE_FUNCTION_TIMEOUT", None)
-        os.environ["USE_IN_MEMORY_CACHE"] = "true"
-        scraper = paperscraper.Scraper()
-        scraper.register_scraper(
-            openaccess_scraper, attach_session=True, rate_limit=RateLimits.SCRAPER.value
+    mock_session = MagicMock()
+    call_index = 0
+
+    @contextlib.asynccontextmanager
+    async def mock_session_get(*_, **__):
+        mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+        nonlocal call_index
+        call_index += 1
+        if call_index == 1:
+            mock_response.text.side_effect = [
+                '<a class="suppl-anchor" href="/doi/suppl/10.1021/acs.nanolett.0c00513/suppl_file/nl0c00513_si_001.pdf">'  # noqa: E501
+            ]
+        else:
+            mock_response.headers = {"Content-Type": "application/pdf;charset=UTF-8"}
+            mock_response.content.at_eof.return_value = False
+            mock_chunks = mock_response.content.iter_chunked.return_value
+            mock_chunks.__aiter__.return_value = [b"%PD", b"F-1.7 st", b"ub"]
+        yield mock_response
+
+    mock_session.get.side_effect = mock_session_get
+    await openaccess_scraper(
+        {
+            "openAccessPdf": {
+                "url": "https://pubs.acs.org/doi/abs/10.1021/acs.nanolett.0c00513"
+            }
+        },
+        tmp_path / "test1.pdf",
+        mock_session,
+    )
+    assert (tmp_path / "test1.pdf").read_bytes() == b"%PDF-1.7 stub"
+
+
+async def test_save_response_not_pdf(tmp_path: Path) -> None:
+    mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+    mock_response.content.at_eof.return_value = False
+    mock_chunks = mock_response.content.iter_chunked.return_value
+    mock_chunks.__aiter__.return_value = [b"<!DOCTYPE html>", b"<html></html>"]
+    with pytest.raises(RuntimeError, match="isn't a PDF"):
+        await save_response(mock_response, tmp_path / "test.pdf")
+    assert not (tmp_path / "test.pdf").exists()
+
+    # Junk before the PDF magic is fine, as long as it's within the header
+    mock_chunks.__aiter__.return_value = [b"\xef\xbb\xbf\n%PD", b"F-1.7 stub"]
+    await save_response(mock_response, tmp_path / "test.pdf")
+    assert (tmp_path / "test.pdf").read_bytes() == b"\xef\xbb\xbf\n%PDF-1.7 stub"
+
+
+async def test_save_response_stream_error(tmp_path: Path) -> None:
+    async def failing_chunks() -> AsyncIterator[bytes]:
+        yield b"%PDF-1.7 "
+        raise aiohttp.ClientPayloadError("Connection reset mid-body")
+
+    mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+    mock_response.content.at_eof.return_value = False
+    mock_response.content.iter_chunked.return_value = failing_chunks()
+    with pytest.raises(aiohttp.ClientPayloadError):
+        await save_response(mock_response, tmp_path / "test.pdf")
+    assert not list(tmp_path.iterdir()), "Expected no partial download left behind"
+
+
+_SEARCH_PAPERS_CASES: tuple[tuple[str, dict[str, Any], int], ...] = (
+    ("molecular dynamics", {"limit": 1}, 1),
+    ("molecular dynamics", {"limit": 10, "_limit": 5}, 10),  # Offset across pages
+    (
+        "meta-reinforcement learning meta reinforcement learning",
+        {"limit": 3, "verbose": True},
+        3,
+    ),
+    ("Fungi", {"limit": 1, "verbose": False}, 1),
+)
+
+
+@pytest.mark.network
+async def test_search_papers(tmp_path: Path) -> None:
+    # Searches are independent, so run them concurrently, each with its own pdir
+    # since overlapping searches can scrape the same paper
+    results = await asyncio.gather(*(
+        paperscraper.a_search_papers(query, pdir=tmp_path / str(i), **kwargs)
+        for i, (query, kwargs, _) in enumerate(_SEARCH_PAPERS_CASES)
+    ))
+    for (query, kwargs, min_count), papers in zip(
+        _SEARCH_PAPERS_CASES, results, strict=True
+    ):
+        assert len(papers) >= min_count, f"Failed search {query!r} with {kwargs}."
+
+
+@pytest.mark.network
+async def test_search_papers_year(tmp_path: Path) -> None:
+    query = "covid vaccination"
+    cases = [
+        ("2019-2023", "normal range"),
+        ("2023-2022", "flipped order"),
+        (". 2021-2023", "discard upon bad formatting"),
+    ]
+    results = await asyncio.gather(*(
+        paperscraper.a_search_papers(
+            query, limit=1, year=year, pdir=tmp_path / str(i)
         )
-        tic = time.perf_counter()
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            assert not await scraper.scrape(
-                {
-                    "title": (
-                        "Martini 3: a general purpose force field for coarse-grained"
-                        " molecular dynamics"
-                    ),
-                    "externalIds": {"DOI": "10.1038/s41592-021-01098-3"},
-                    "openAccessPdf": {
-                        # NOTE: swapped actual for non-routable IP address to avoid CI flakiness
-                        "url": "https://10.255.255.1/test.pdf"
-                    },
+        for i, (year, _) in enumerate(cases)
+    ))
+    for (_, name), papers in zip(cases, results, strict=True):
+        assert len(papers) >= 1, f"Failed search with {name}."
+
+
+@pytest.mark.network
+async def test_custom_scraper(tmp_path: Path) -> None:
+    query = "covid vaccination"
+    mock_scrape_fn = MagicMock()
+
+    async def custom_scraper(paper, path, **kwargs):
+        mock_scrape_fn(paper, path, **kwargs)
+
+    scraper = paperscraper.Scraper()
+    scraper.register_scraper(custom_scraper, priority=0, name="test", check=False)
+    try:
+        await paperscraper.a_search_papers(query, scraper=scraper, pdir=tmp_path)
+    except RuntimeError as exc:
+        assert (  # noqa: PT017
+            exc.__cause__.status == 400  # type: ignore[union-attr]
+        ), "Expected we should exhaust the search"
+
+
+@pytest.mark.network
+async def test_scraper_callback(tmp_path: Path) -> None:
+    # make sure default scraper doesn't duplicate scrapers
+    async def callback(paper, result):  # noqa: ARG001
+        assert len(result) > 5
+
+    # Not the shared default_scraper fixture, since a_search_papers closes its scraper
+    scraper = paperscraper.default_scraper(callback=callback)
+    papers = await paperscraper.a_search_papers(  # noqa: F841
+        "test", limit=1, scraper=scraper, pdir=tmp_path
+    )
+
+
+def test_scrape_default_timeout() -> None:
+    os.environ.pop("PAPERSCRAPER_SCRAPE_FUNCTION_TIMEOUT", None)
+    assert paperscraper.Scraper.SCRAPE_FUNCTION_TIMEOUT == 60.0
+
+
+@pytest.mark.network
+async def test_scraper_timeout(tmp_path: Path) -> None:
+    os.environ.pop("PAPERSCRAPER_SCRAPE_FUNCTION_TIMEOUT", None)
+    os.environ["USE_IN_MEMORY_CACHE"] = "true"
+    scraper = paperscraper.Scraper()
+    scraper.register_scraper(
+        openaccess_scraper, attach_session=True, rate_limit=RateLimits.SCRAPER.value
+    )
+    tic = time.perf_counter()
+    assert not await scraper.scrape(
+        {
+            "title": (
+                "Martini 3: a general purpose force field for coarse-grained"
+                " molecular dynamics"
+            ),
+            "externalIds": {"DOI": "10.1038/s41592-021-01098-3"},
+            "openAccessPdf": {
+                # NOTE: swapped actual for non-routable IP address to avoid CI flakiness
+                "url": "https://10.255.255.1/test.pdf"
+            },
+        },
+        tmp_path / "test.pdf",
+    ), "Scrape was supposed to time out"
+    assert 55.0 < time.perf_counter() - tic < 65.0, "Expected test to be about 1-min"
+
+
+@pytest.mark.network
+async def test_parser_runtime_error_doesnt_crash_us(tmp_path: Path) -> None:
+    mock_scraper = AsyncMock(name="stub", side_effect=[True])
+    scraper = paperscraper.Scraper()
+    scraper.register_scraper(mock_scraper, name="stub", check=False)
+    async with ThrottledClientSession(
+        rate_limit=RateLimits.GOOGLE_SCHOLAR.value
+    ) as session:
+        assert not await scraper.batch_scrape(
+            papers=[{
+                "title": (
+                    "An essential role of active site arginine residue in"
+                    " iodide binding and histidine residue in electron"
+                    " transfer for iodide oxidation by horseradish"
+                    " peroxidase"
+                ),
+                "inline_links": {
+                    "serpapi_cite_link": "https://serpapi.com/search.json?engine=google_scholar_cite&hl=en&q=uWOXVY5eGm8J",
                 },
-                tmpfile.name,
-            ), "Scrape was supposed to time out"
-        assert (
-            55.0 < time.perf_counter() - tic < 65.0
-        ), "Expected test to be about 1-min"
-
-    async def test_parser_runtime_error_doesnt_crash_us(self) -> None:
-        mock_scraper = AsyncMock(name="stub", side_effect=[True])
-        scraper = paperscraper.Scraper()
-        scraper.register_scraper(mock_scraper, name="stub", check=False)
-        with tempfile.TemporaryDirectory() as tmpdir:
-            async with ThrottledClientSession(
-                rate_limit=RateLimits.GOOGLE_SCHOLAR.value
-            ) as session:
-                assert not await scraper.batch_scrape(
-                    papers=[{
-                        "title": (
-                            "An essential role of active site arginine residue in"
-                            " iodide binding and histidine residue in electron"
-                            " transfer for iodide oxidation by horseradish"
-                            " peroxidase"
-                        ),
-                        "inline_links": {
-                            "serpapi_cite_link": "https://serpapi.com/search.json?engine=google_scholar_cite&hl=en&q=uWOXVY5eGm8J",
-                        },
-                        "externalIds": {"DOI": "10.1023/A:1007154515475"},
-                        "paperId": "stub",
-                    }],
-                    paper_file_dump_dir=tmpdir,
-                    paper_parser=partial(
-                        parse_google_scholar_metadata, session=session
-                    ),
-                ), "Expected empty return because this test checks for parser failure"
-        mock_scraper.assert_awaited_once()
-
-
-class Test8(IsolatedAsyncioTestCase):
-    async def test_scraper_length(self):
-        # make sure default scraper doesn't duplicate scrapers
-        scraper = paperscraper.default_scraper()
-        assert len(scraper.scrapers) == sum([len(s) for s in scraper.sorted_scrapers])
-
-
-class Test10(IsolatedAsyncioTestCase):
-    async def test_scraper_paper_search(self):
-        # make sure default scraper doesn't duplicate scrapers
-        papers = await paperscraper.a_search_papers(
-            "649def34f8be52c8b66281af98ae884c09aef38b",
-            limit=1,
-            search_type="paper_recommendations",
-        )
-        assert len(papers) >= 1
+                "externalIds": {"DOI": "10.1023/A:1007154515475"},
+                "paperId": "stub",
+            }],
+            paper_file_dump_dir=tmp_path,
+            paper_parser=partial(parse_google_scholar_metadata, session=session),
+        ), "Expected empty return because this test checks for parser failure"
+    mock_scraper.assert_awaited_once()
 
 
-class Test11(IsolatedAsyncioTestCase):
-    async def test_scraper_doi_search(self):
-        for _ in range(3):  # Retrying upon unsuccessful scrape
-            papers = await paperscraper.a_search_papers(
-                "10.1016/j.ccell.2021.11.002", limit=1, search_type="doi"
-            )
-            if len(papers) >= 1:
-                return
-        raise AssertionError("Failed to acquire a paper from DOI search.")
+def test_scraper_length(default_scraper: paperscraper.Scraper) -> None:
+    # make sure default scraper doesn't duplicate scrapers
+    assert len(default_scraper.scrapers) == sum([
+        len(s) for s in default_scraper.sorted_scrapers
+    ])
 
 
-class Test12(IsolatedAsyncioTestCase):
-    async def test_future_citation_search(self):
-        # make sure default scraper doesn't duplicate scrapers
-        papers = await paperscraper.a_search_papers(
-            "649def34f8be52c8b66281af98ae884c09aef38b",
-            limit=1,
-            search_type="future_citations",
-        )
-        assert len(papers) >= 1
+_S2_PAPER_ID = "649def34f8be52c8b66281af98ae884c09aef38b"
 
 
-class Test13(IsolatedAsyncioTestCase):
-    async def test_past_references_search(self):
-        # make sure default scraper doesn't duplicate scrapers
-        papers = await paperscraper.a_search_papers(
-            "649def34f8be52c8b66281af98ae884c09aef38b",
-            limit=1,
-            search_type="past_references",
-        )
-        assert len(papers) >= 1
+@pytest_asyncio.fixture(scope="module")
+async def s2_paper_batch(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> dict[str, dict[str, dict]]:
+    """Map each of one paper's related-paper search types to its search results."""
+    search_types = ("paper_recommendations", "future_citations", "past_references")
+    pdir = tmp_path_factory.mktemp("s2_paper_batch")
+    results = await asyncio.gather(*(
+        paperscraper.a_search_papers(_S2_PAPER_ID, limit=1, search_type=t, pdir=pdir)
+        for t in search_types
+    ))
+    return dict(zip(search_types, results, strict=True))
 
 
-class Test14(IsolatedAsyncioTestCase):
-    async def test_scraper_doi_search(self):
-        try:
-            papers = await paperscraper.a_search_papers(  # noqa: F841
-                "10.23919/eusipco55093.2022.9909972", limit=1, search_type="doi"
-            )
-        except Exception as e:
-            assert isinstance(e, DOINotFoundError)  # noqa: PT017
+@pytest.mark.network
+def test_scraper_paper_search(s2_paper_batch: dict[str, dict[str, dict]]) -> None:
+    assert len(s2_paper_batch["paper_recommendations"]) >= 1
+
+
+_DOI_SEARCH_CASES = (
+    pytest.param("10.1016/j.ccell.2021.11.002", None, id="found"),
+    pytest.param(
+        "10.23919/eusipco55093.2022.9909972", DOINotFoundError, id="not-found"
+    ),
+)
 
 
-class Test15(IsolatedAsyncioTestCase):
-    async def test_pdf_link_from_google(self):
+@pytest.mark.network
+@pytest.mark.parametrize(("doi", "expected_exc"), _DOI_SEARCH_CASES)
+async def test_scraper_doi_search(
+    doi: str, expected_exc: type[Exception] | None, tmp_path: Path
+) -> None:
+    if expected_exc is not None:
+        with pytest.raises(expected_exc):
+            await paperscraper.a_search_papers(
+                doi, limit=1, search_type="doi", pdir=tmp_path
+            )
+        return
+    for _ in range(3):  # Retrying upon unsuccessful scrape
         papers = await paperscraper.a_search_papers(
-            "Multiplex Base Editing to Protect from CD33-Directed Therapy: Implications"
-            " for Immune and Gene Therapy",
-            limit=1,
-            search_type="google",
+            doi, limit=1, search_type="doi", pdir=tmp_path
         )
-        assert len(papers) == 1
-
-
-class Test16(IsolatedAsyncioTestCase):
-    def test_format_bibtex(self) -> None:
-        bibtex = """
-            @['JournalArticle']{Salomón-Ferrer2013RoutineMM,
-                author = {Romelia Salomón-Ferrer and A. Götz and D. Poole and S. Le Grand and R. Walker},
-                booktitle = {Journal of Chemical Theory and Computation},
-                journal = {Journal of chemical theory and computation},
-                pages = {
-                        3878-88
-                        },
-                title = {Routine Microsecond Molecular Dynamics Simulations with AMBER on GPUs. 2. Explicit Solvent Particle Mesh Ewald.},
-                volume = {9 9},
-                year = {2013}
-            }
-        """  # noqa: E501
-        text = "Romelia Salomón-Ferrer, A. Götz, D. Poole, S. Le Grand, and R. Walker. Routine microsecond molecular dynamics simulations with amber on gpus. 2. explicit solvent particle mesh ewald. Journal of chemical theory and computation, 9 9:3878-88, 2013."  # noqa: E501
-        assert paperscraper.format_bibtex(bibtex, "Salomón-Ferrer2013RoutineMM") == text
-
-        bibtex2 = """
-                @['Review']{Kianfar2019ComparisonAA,
-            author = {E. Kianfar},
-            booktitle = {Reviews in Inorganic Chemistry},
-            journal = {Reviews in Inorganic Chemistry},
-            pages = {157 - 177},
-            title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
-            volume = {39},
-            year = {2019}
-            }
-        """  # noqa: E501
-
-        parse_string(clean_upbibtex(bibtex2), "bibtex")
-
-        bibtex3 = """
-        @None{Kianfar2019ComparisonAA,
-            author = {E. Kianfar},
-            booktitle = {Reviews in Inorganic Chemistry},
-            journal = {Reviews in Inorganic Chemistry},
-            pages = {157 - 177},
-            title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
-            volume = {39},
-            year = {2019}
-        }
-        """  # noqa: E501
-
-        parse_string(clean_upbibtex(bibtex3), "bibtex")
-
-        bibtex4 = """
-        @['Review', 'JournalArticle', 'Some other stuff']{Kianfar2019ComparisonAA,
-            author = {E. Kianfar},
-            booktitle = {Reviews in Inorganic Chemistry},
-            journal = {Reviews in Inorganic Chemistry},
-            pages = {157 - 177},
-            title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
-            volume = {39},
-            year = {2019}
-        }
-        """  # noqa: E501
+        if len(papers) >= 1:
+            return
+    raise AssertionError("Failed to acquire a paper from DOI search.")
+
+
+async def test_search_papers_batch_mocked(tmp_path: Path) -> None:
+    dois = [f"10.1234/{i}" for i in range(SEMANTIC_SCHOLAR_BATCH_MAX_IDS + 1)]
+    batch_sizes: list[int] = []
+
+    @contextlib.asynccontextmanager
+    async def mock_post(*_, json: dict[str, list[str]], **__):
+        batch_sizes.append(len(json["ids"]))
+        mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+        # Semantic Scholar responds with null for IDs it doesn't have
+        mock_response.json.return_value = [
+            {"paperId": id_} if i % 2 == 0 else None
+            for i, id_ in enumerate(json["ids"])
+        ]
+        yield mock_response
+
+    scraper = MagicMock(spec_set=paperscraper.Scraper)
+    scraper.batch_scrape.return_value = {}
+    with patch.object(ThrottledClientSession, "post", side_effect=mock_post):
+        await paperscraper.a_search_papers_batch(dois, pdir=tmp_path, scraper=scraper)
+    assert batch_sizes == [SEMANTIC_SCHOLAR_BATCH_MAX_IDS, 1]
+    (papers,), _ = scraper.batch_scrape.call_args
+    assert [p["paperId"] for p in papers] == [
+        *(f"DOI:{doi}" for doi in dois[:SEMANTIC_SCHOLAR_BATCH_MAX_IDS:2]),
+        f"DOI:{dois[-1]}",  # First of the second batch
+    ], "Expected null entries to be skipped"
+    scraper.close.assert_awaited_once()
+
+    @contextlib.asynccontextmanager
+    async def mock_post_error(*_, **__):
+        mock_response = MagicMock(spec_set=aiohttp.ClientResponse)
+        mock_response.raise_for_status.side_effect = ClientResponseError(
+            MagicMock(), ()
+        )
+        yield mock_response
+
+    with (
+        patch.object(ThrottledClientSession, "post", side_effect=mock_post_error),
+        pytest.raises(RuntimeError, match=r"^Error looking up DOIs 1 to 500 of 501\.$"),
+    ):
+        await paperscraper.a_search_papers_batch(dois, pdir=tmp_path, scraper=scraper)
+
+
+@pytest.mark.network
+async def test_search_papers_batch(tmp_path: Path) -> None:
+    dois = ["10.1016/j.ccell.2021.11.002", "10.23919/eusipco55093.2022.9909972"]
+    for _ in range(3):  # Retrying upon unsuccessful scrape
+        # The second DOI isn't in Semantic Scholar, so it should be skipped
+        papers = await paperscraper.a_search_papers_batch(dois, pdir=tmp_path)
+        if len(papers) == 1:
+            return
+    raise AssertionError("Failed to acquire a paper from DOI batch search.")
+
+
+@pytest.mark.network
+def test_future_citation_search(s2_paper_batch: dict[str, dict[str, dict]]) -> None:
+    assert len(s2_paper_batch["future_citations"]) >= 1
+
+
+@pytest.mark.network
+def test_past_references_search(s2_paper_batch: dict[str, dict[str, dict]]) -> None:
+    assert len(s2_paper_batch["past_references"]) >= 1
 
-        parse_string(clean_upbibtex(bibtex4), "bibtex")
 
-        bibtex5 = """
-        @Review{Escobar2020BCGVP,
-            author = {Luis E. Escobar and A. Molina-Cruz and C. Barillas-Mury},
-            title = {BCG Vaccine Protection from Severe Coronavirus Disease 2019 (COVID19)},
-            year = {2020}
+@pytest.mark.network
+async def test_pdf_link_from_google(tmp_path: Path) -> None:
+    papers = await paperscraper.a_search_papers(
+        "Multiplex Base Editing to Protect from CD33-Directed Therapy: Implications"
+        " for Immune and Gene Therapy",
+        limit=1,
+        search_type="google",
+        pdir=tmp_path,
+    )
+    assert len(papers) == 1
+
+
+_CLEAN_UPBIBTEX_CASES = (
+    pytest.param(
+        """
+            @['Review']{Kianfar2019ComparisonAA,
+        author = {E. Kianfar},
+        booktitle = {Reviews in Inorganic Chemistry},
+        journal = {Reviews in Inorganic Chemistry},
+        pages = {157 - 177},
+        title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
+        volume = {39},
+        year = {2019}
         }
+    """,  # noqa: E501
+        "Kianfar2019ComparisonAA",
+        id="list-type",
+    ),
+    pytest.param(
+        """
+    @None{Kianfar2019ComparisonAA,
+        author = {E. Kianfar},
+        booktitle = {Reviews in Inorganic Chemistry},
+        journal = {Reviews in Inorganic Chemistry},
+        pages = {157 - 177},
+        title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
+        volume = {39},
+        year = {2019}
+    }
+    """,  # noqa: E501
+        "Kianfar2019ComparisonAA",
+        id="none-type",
+    ),
+    pytest.param(
         """
+    @['Review', 'JournalArticle', 'Some other stuff']{Kianfar2019ComparisonAA,
+        author = {E. Kianfar},
+        booktitle = {Reviews in Inorganic Chemistry},
+        journal = {Reviews in Inorganic Chemistry},
+        pages = {157 - 177},
+        title = {Comparison and assessment of zeolite catalysts performance dimethyl ether and light olefins production through methanol: a review},
+        volume = {39},
+        year = {2019}
+    }
+    """,  # noqa: E501
+        "Kianfar2019ComparisonAA",
+        id="multiple-list-types",
+    ),
+    pytest.param(
+        """
+    @Review{Escobar2020BCGVP,
+        author = {Luis E. Escobar and A. Molina-Cruz and C. Barillas-Mury},
+        title = {BCG Vaccine Protection from Severe Coronavirus Disease 2019 (COVID19)},
+        year = {2020}
+    }
+    """,
+        "Escobar2020BCGVP",
+        id="plain-type",
+    ),
+)
 
-        parse_string(clean_upbibtex(bibtex5), "bibtex")
-
-        # Edge case where there is no title or author
-        bibtex6 = """
-        @article{2023,
-            volume = {383},
-            ISSN = {0378-4274},
-            url = {http://dx.doi.org/10.1016/j.toxlet.2023.05.004},
-            DOI = {10.1016/j.toxlet.2023.05.004},
-            journal = {Toxicology Letters},
-            publisher = {Elsevier BV},
-            year = {2023},
-            month = jul,
-            pages = {33–42}
-        }
-        """  # noqa: RUF001
-        key: str = bibtex6.split("{")[1].split(",")[0]
-        # Check callers can intuit this conversion's failure
-        with contextlib.suppress(CitationConversionError):
-            format_bibtex(bibtex6, key, clean=False)
-
-        # This BibTeX apparent has a trailing slash in its title
-        bibtex7 = r"""
-        @article{Jain2014Antioxidant,
-            title={Antioxidant and Antibacterial Activities of Spondias pinnata Kurz. Leaves\},
-            volume={4},
-            ISSN={2231-0894},
-            url={http://dx.doi.org/10.9734/ejmp/2014/7048},
-            DOI={10.9734/ejmp/2014/7048},
-            number={2},
-            journal={European Journal of Medicinal Plants},
-            publisher={Sciencedomain International},
-            author={Jain, Preeti},
-            year={2014},
-            month=jan,
-            pages={183–195}
-        }
-        """  # noqa: RUF001
-        assert (
-            "Antioxidant and Antibacterial Activities of Spondias pinnata"
-            in format_bibtex(
-                bibtex7, key=bibtex7.split("{")[1].split(",")[0], clean=False
-            )
+
+@pytest.mark.parametrize(("bibtex", "key"), _CLEAN_UPBIBTEX_CASES)
+def test_clean_upbibtex(bibtex: str, key: str) -> None:
+    assert key in parse_bibtex_string(clean_upbibtex(bibtex)).entries
+
+
+_SALOMON_FERRER_BIBTEX = """
+    @['JournalArticle']{Salomón-Ferrer2013RoutineMM,
+        author = {Romelia Salomón-Ferrer and A. Götz and D. Poole and S. Le Grand and R. Walker},
+        booktitle = {Journal of Chemical Theory and Computation},
+        journal = {Journal of chemical theory and computation},
+        pages = {
+                3878-88
+                },
+        title = {Routine Microsecond Molecular Dynamics Simulations with AMBER on GPUs. 2. Explicit Solvent Particle Mesh Ewald.},
+        volume = {9 9},
+        year = {2013}
+    }
+"""  # noqa: E501
+
+# Edge case where there is no title or author
+_NO_TITLE_OR_AUTHOR_BIBTEX = """
+@article{2023,
+    volume = {383},
+    ISSN = {0378-4274},
+    url = {http://dx.doi.org/10.1016/j.toxlet.2023.05.004},
+    DOI = {10.1016/j.toxlet.2023.05.004},
+    journal = {Toxicology Letters},
+    publisher = {Elsevier BV},
+    year = {2023},
+    month = jul,
+    pages = {33–42}
+}
+"""  # noqa: RUF001
+
+# This BibTeX apparent has a trailing slash in its title
+_TRAILING_SLASH_TITLE_BIBTEX = r"""
+@article{Jain2014Antioxidant,
+    title={Antioxidant and Antibacterial Activities of Spondias pinnata Kurz. Leaves\},
+    volume={4},
+    ISSN={2231-0894},
+    url={http://dx.doi.org/10.9734/ejmp/2014/7048},
+    DOI={10.9734/ejmp/2014/7048},
+    number={2},
+    journal={European Journal of Medicinal Plants},
+    publisher={Sciencedomain International},
+    author={Jain, Preeti},
+    year={2014},
+    month=jan,
+    pages={183–195}
+}
+"""  # noqa: RUF001
+
+
+def test_format_bibtex() -> None:
+    text = "Romelia Salomón-Ferrer, A. Götz, D. Poole, S. Le Grand, and R. Walker. Routine microsecond molecular dynamics simulations with amber on gpus. 2. explicit solvent particle mesh ewald. Journal of chemical theory and computation, 9 9:3878-88, 2013."  # noqa: E501
+    assert (
+        paperscraper.format_bibtex(
+            _SALOMON_FERRER_BIBTEX, "Salomón-Ferrer2013RoutineMM"
         )
+        == text
+    )
+
+    key: str = _NO_TITLE_OR_AUTHOR_BIBTEX.split("{")[1].split(",")[0]
+    # Check callers can intuit this conversion's failure
+    with pytest.raises(CitationConversionError):
+        format_bibtex(_NO_TITLE_OR_AUTHOR_BIBTEX, key, clean=False)
+
+    key = _TRAILING_SLASH_TITLE_BIBTEX.split("{")[1].split(",")[0]
+    citation = format_bibtex(_TRAILING_SLASH_TITLE_BIBTEX, key=key, clean=False)
+    assert "Antioxidant and Antibacterial Activities of Spondias pinnata" in citation